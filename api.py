@@ -0,0 +1,258 @@
+import hashlib
+import json
+from datetime import datetime
+
+from flask import Blueprint, Response, abort, current_app, request, stream_with_context
+from models import db, Venue, Artist, Show
+from queries import (
+    normalize_letter,
+    venue_directory,
+    artist_directory,
+    venue_detail,
+    artist_detail,
+    show_feed,
+    nearby_venues,
+    show_tile,
+    show_tiles
+)
+import search
+import exporter
+from importer import record_data
+from scheduling import schedule_shows
+
+#----------------------------------------------------------------------------#
+# JSON API.
+#----------------------------------------------------------------------------#
+
+# Versioned JSON next to the HTML views, built on the same loaders. Every
+# GET response carries an ETag (weakened when compressed, and compared
+# weakly): detail pages derive it from the row version, so a matching
+# If-None-Match is answered with a 304 before the page is loaded; lists
+# hash their compact JSON body. The one write endpoint, POST
+# /shows/schedule, books shows through schedule_shows like the HTML form.
+# It is as open as the site's forms (there are no accounts). It only takes
+# an application/json body, which a browser will not send cross-site
+# without a CORS preflight the API never answers, so other sites cannot
+# post to it. Batches are capped at SCHEDULE_MAX_BATCH shows, and each one
+# is validated and checked for overlaps under advisory locks.
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError('%r is not JSON serializable' % value)
+
+def dumps(payload):
+    return json.dumps(payload, separators=(',', ':'), default=_default)
+
+def parse_fields(fields):
+    return set(field.strip() for field in fields.split(',')) if fields else None
+
+def _fields():
+    return parse_fields(request.args.get('fields'))
+
+def select_fields(item, fields):
+    if fields is None:
+        return item
+    return dict((key, value) for key, value in item.items() if key in fields)
+
+def _per_page(default):
+    per_page = request.args.get('per_page', default, type=int)
+    return max(1, min(per_page, current_app.config['API_MAX_PAGE_SIZE']))
+
+def _not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+def respond(payload, etag=None):
+    body = dumps(payload)
+    if etag is None:
+        etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        return _not_modified(etag)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
+def paginated(page):
+    fields = _fields()
+    return respond({
+        'data': [select_fields(item, fields) for item in page.items],
+        'page': page.page,
+        'per_page': page.per_page,
+        'pages': page.pages,
+        'total': page.total,
+    })
+
+def detail_etag(kind, entity_id, version, fields):
+    etag = '%s-%d-v%d' % (kind, entity_id, version)
+    if fields is not None:
+        # each field selection is its own representation
+        etag += '-' + hashlib.sha1(','.join(sorted(fields)).encode('utf-8')).hexdigest()[:12]
+    return etag
+
+def detail(kind, entity, entity_id, load):
+    # the row version is a primary key lookup; only a changed row is loaded
+    version = db.session.query(entity.version).filter_by(id=entity_id).scalar()
+    if version is None:
+        abort(404)
+    fields = _fields()
+    etag = detail_etag(kind, entity_id, version, fields)
+    if request.if_none_match.contains_weak(etag):
+        return _not_modified(etag)
+    data = load(entity_id)
+    if data is None:
+        abort(404)
+    return respond(select_fields(data, fields), etag)
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def error(err):
+    body = json.dumps({'error': err.code, 'message': err.description}, separators=(',', ':'))
+    return Response(body, status=err.code, mimetype='application/json')
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@api.route('/venues')
+def venues():
+    return paginated(venue_directory(
+        page=request.args.get('page', 1, type=int),
+        per_page=_per_page(current_app.config['VENUE_AREAS_PER_PAGE']),
+        letter=normalize_letter(request.args.get('letter'))
+    ))
+
+@api.route('/venues/search')
+def search_venues():
+    return paginated(search.search_venues(
+        request.args.get('q', ''),
+        page=request.args.get('page', 1, type=int),
+        per_page=_per_page(current_app.config['SEARCH_PAGE_SIZE'])
+    ))
+
+@api.route('/venues/nearby')
+def nearby():
+    # ?lat=37.77&lng=-122.42&miles=10&limit=20
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lng', type=float)
+    if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        abort(400, 'lat and lng must be a point in degrees')
+    miles = request.args.get('miles', current_app.config['NEARBY_MILES'], type=float)
+    miles = max(0, min(miles, current_app.config['NEARBY_MAX_MILES']))
+    limit = request.args.get('limit', current_app.config['NEARBY_LIMIT'], type=int)
+    limit = max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+    fields = _fields()
+    return respond({'data': [select_fields(item, fields) for item in
+                             nearby_venues(latitude, longitude, miles, limit)]})
+
+@api.route('/venues/<int:venue_id>')
+def show_venue(venue_id):
+    return detail('venue', Venue, venue_id, venue_detail)
+
+#  Artists
+#  ----------------------------------------------------------------
+
+@api.route('/artists')
+def artists():
+    return paginated(artist_directory(
+        page=request.args.get('page', 1, type=int),
+        per_page=_per_page(current_app.config['ARTISTS_PER_PAGE']),
+        letter=normalize_letter(request.args.get('letter'))
+    ))
+
+@api.route('/artists/search')
+def search_artists():
+    return paginated(search.search_artists(
+        request.args.get('q', ''),
+        page=request.args.get('page', 1, type=int),
+        per_page=_per_page(current_app.config['SEARCH_PAGE_SIZE'])
+    ))
+
+@api.route('/artists/<int:artist_id>')
+def show_artist(artist_id):
+    return detail('artist', Artist, artist_id, artist_detail)
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@api.route('/shows')
+def shows():
+    try:
+        feed = show_feed(
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            limit=_per_page(current_app.config['SHOWS_PAGE_SIZE'])
+        )
+    except ValueError:
+        abort(400, 'invalid cursor')
+    fields = _fields()
+    return respond({
+        'data': [select_fields(item, fields) for item in feed.items],
+        'prev': feed.prev_cursor,
+        'next': feed.next_cursor,
+    })
+
+@api.route('/shows/schedule', methods=['POST'])
+def schedule():
+    # {"shows": [{"artist_id", "venue_id", "start_time", "duration"}, ...],
+    #  "atomic": false}; start_time is "YYYY-MM-DD HH:MM:SS", duration minutes
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('shows'), list):
+        abort(400, 'expected a JSON object with a "shows" list')
+    shows = body['shows']
+    if len(shows) > current_app.config['SCHEDULE_MAX_BATCH']:
+        abort(400, 'at most %d shows per batch' % current_app.config['SCHEDULE_MAX_BATCH'])
+    if not all(isinstance(show, dict) for show in shows):
+        abort(400, 'every show must be a JSON object')
+    result = schedule_shows([record_data(show) for show in shows], atomic=bool(body.get('atomic')))
+    db.session.commit()
+    if result['scheduled']:
+        status = 201
+    elif result['conflicts']:
+        status = 409
+    else:
+        status = 400 if result['errors'] else 200
+    body = json.dumps(result, separators=(',', ':'))
+    return Response(body, status=status, mimetype='application/json')
+
+@api.route('/shows/search')
+def search_shows():
+    return paginated(search.search_shows(
+        request.args.get('q', ''),
+        page=request.args.get('page', 1, type=int),
+        per_page=_per_page(current_app.config['SEARCH_PAGE_SIZE'])
+    ))
+
+@api.route('/shows/<int:show_id>')
+def show(show_id):
+    row = show_tiles().filter(Show.id == show_id).first()
+    if row is None:
+        abort(404)
+    return respond(select_fields(show_tile(row), _fields()))
+
+#  Export
+#  ----------------------------------------------------------------
+
+@api.route('/export/<entity>')
+def export(entity):
+    # streamed straight from a server-side cursor; the watermark header is
+    # the `since` to send on the next incremental export
+    if entity not in exporter.ENTITIES:
+        abort(404)
+    format = request.args.get('format', 'ndjson')
+    if format not in exporter.FORMATS:
+        abort(400, 'format must be one of %s' % ', '.join(exporter.FORMATS))
+    try:
+        since = exporter.parse_since(request.args.get('since'))
+    except ValueError:
+        abort(400, 'invalid since')
+    mark = exporter.watermark(current_app.config['EXPORT_OVERLAP'])
+    chunks = exporter.export(exporter.ENTITIES[entity], format, since,
+                             current_app.config['EXPORT_BATCH_SIZE'])
+    response = Response(stream_with_context(chunks), mimetype=exporter.MIMETYPES[format])
+    response.headers['X-Export-Watermark'] = mark.isoformat()
+    response.headers['Content-Disposition'] = 'attachment; filename=%s.%s' % (
+        entity, 'csv' if format == 'csv' else 'ndjson')
+    return response
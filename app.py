@@ -3,56 +3,151 @@
 #----------------------------------------------------------------------------#
 
 import json
-import dateutil.parser
-import babel
-from datetime import datetime
+import os
+from datetime import datetime, timedelta
 from flask import (
   Flask,
+  current_app,
   render_template,
   request,
   Response,
   flash,
   redirect,
-  url_for
+  url_for,
+  abort
 )
 from flask_migrate import Migrate
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
-from forms import VenueForm, ArtistForm, ShowForm
+from forms import VenueForm, ArtistForm, ShowForm, genre_choices, state_choices
 import logging
 from logging import Formatter, FileHandler
 from models import db, Venue, Artist, Show
+from queries import (
+  LETTERS,
+  normalize_letter,
+  venue_directory,
+  artist_directory,
+  venue_detail,
+  artist_detail,
+  show_feed,
+  genre_counts,
+  genre_page
+)
+import search
+from counters import counters_cli, delete_venue_shows
+from scheduling import schedule_shows
+from upcoming import (
+  calendar_cli,
+  calendar_day,
+  calendar_days,
+  calendar_range,
+  update_venue_upcoming,
+  update_artist_upcoming
+)
+from formatting import format_datetime, format_datetimes
+from cache import fragment_cache, touch_venues_of_artist, touch_artists_of_venue
+from api import api
+from importer import import_cli
+from exporter import export_cli
+from geocoder import geocode_cli, forget_location
+from templating import init_template_cache, templates_cli
+from assets import assets, assets_cli
+from compression import compressor
+from httpcache import http_cache, cache_policy
+from pool import init_pool
+from metrics import metrics, request_metrics
+from profiler import query_profiler
 from flask_wtf import FlaskForm
 from forms import *
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db.init_app(app)
-migrate = Migrate(app, db)
-
-#----------------------------------------------------------------------------#
-# Filters.
-#----------------------------------------------------------------------------#
-
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value) if isinstance(value, str) else value
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
-
-app.jinja_env.filters['datetime'] = format_datetime
+moment = Moment()
+migrate = Migrate()
+
+# Views register here and are bound to each app by create_app(), keeping
+# their plain endpoint names ('venues', 'show_venue', ...).
+views = []
+error_views = []
+
+def route(rule, **options):
+  def register(view):
+    views.append((rule, view, options))
+    return view
+  return register
+
+def errorhandler(code):
+  def register(view):
+    error_views.append((code, view))
+    return view
+  return register
+
+def create_app(config=None):
+  # config: settings to apply over config.py, e.g. for benchmarks
+  app = Flask(__name__)
+  app.config.from_object('config')
+  app.config.update(config or {})
+  if not app.config.get('SECRET_KEY') and app.debug:
+    # development only: sessions last as long as the process
+    app.config['SECRET_KEY'] = os.urandom(32)
+
+  init_template_cache(app)
+  compressor.init_app(app)
+  moment.init_app(app)
+  init_pool(app)
+  db.init_app(app)
+  fragment_cache.init_app(app)
+  query_profiler.init_app(app)
+  request_metrics.init_app(app)
+  migrate.init_app(app, db)
+  assets.init_app(app)
+  http_cache.init_app(app)
+  app.cli.add_command(counters_cli)
+  app.cli.add_command(import_cli)
+  app.cli.add_command(export_cli)
+  app.cli.add_command(calendar_cli)
+  app.cli.add_command(geocode_cli)
+  app.cli.add_command(templates_cli)
+  app.cli.add_command(assets_cli)
+  app.register_blueprint(api)
+  app.register_blueprint(metrics)
+
+  app.jinja_env.filters['datetime'] = format_datetime
+  app.jinja_env.filters['datetimes'] = format_datetimes
+
+  for rule, view, options in views:
+    app.add_url_rule(rule, view_func=view, **options)
+  for code, view in error_views:
+    app.register_error_handler(code, view)
+
+  if not app.debug:
+    configure_logging(app)
+  return app
+
+def require_secret_key(app):
+  # for the entry points that serve requests; CLI commands (migrations,
+  # template and asset builds, imports) run without a key
+  if not app.config.get('SECRET_KEY'):
+    raise RuntimeError('set SECRET_KEY in the environment: every worker must sign sessions with the same key')
+  return app
+
+def configure_logging(app):
+  file_handler = FileHandler(app.config['ERROR_LOG'])
+  file_handler.setFormatter(
+      Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+  )
+  app.logger.setLevel(logging.INFO)
+  file_handler.setLevel(logging.INFO)
+  app.logger.addHandler(file_handler)
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
+@route('/')
+@cache_policy()
 def index():
   return render_template('pages/home.html')
 
@@ -60,79 +155,57 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@route('/venues')
+@cache_policy(depends=['Venue'])
 def venues():
-  
-  data = []
-  venues = Venue.query.all()
-  areas = db.session.query(Venue.city, Venue.state).all()
-  for area in areas:
-    data.append({
-        'city': area.city,
-        'state': area.state,
-        'venues': [{
-            'id': venue.id,
-            'name': venue.name,
-        } for venue in venues if
-            venue.city == area.city and venue.state == area.state]
-    })
-  return render_template('pages/venues.html', areas=data);
-
-@app.route('/venues/search', methods=['POST'])
+  letter = normalize_letter(request.args.get('letter'))
+  page = venue_directory(
+      page=request.args.get('page', 1, type=int),
+      per_page=current_app.config['VENUE_AREAS_PER_PAGE'],
+      letter=letter
+  )
+  return render_template('pages/venues.html', areas=page.items, page=page, letter=letter, letters=LETTERS)
+
+@route('/venues/search', methods=['GET', 'POST'])
+@cache_policy(depends=['Venue'])
 def search_venues():
-  search_term=request.form.get('search_term', '')
-  # implements search on venue with partial string search, case-insensitive.
+  # ranked partial, case-insensitive search on name, city, state and genres
+  search_term = request.values.get('search_term', '')
+  page = search.search_venues(
+      search_term,
+      page=request.args.get('page', 1, type=int),
+      per_page=current_app.config['SEARCH_PAGE_SIZE']
+  )
+  response = {"count": page.total, "data": page.items}
+  return render_template('pages/search_venues.html', results=response, page=page, search_term=search_term)
+
+@route('/venues/<int:venue_id>')
+@cache_policy(depends=['Venue', 'Artist', 'Show'])
+def show_venue(venue_id):
+  # the cached fragment is keyed by the row version, a primary key lookup
+  version = db.session.query(Venue.version).filter_by(id=venue_id).scalar()
+  if version is None:
+    abort(404)
 
-  result = Venue.query.filter(Venue.name.ilike('%' + search_term + '%')).all()
-  response = {"count": len(result), "data": result}
-	
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  def render():
+    venue = venue_detail(venue_id)
+    if venue is None:
+      abort(404)
+    return render_template('fragments/venue.html', venue=venue)
 
-@app.route('/venues/<int:venue_id>')
-def show_venue(venue_id):
-  past_shows = db.session.query(Artist, Show).join(Show).join(Venue).\
-    filter(
-        Show.venue_id == venue_id,
-        Show.artist_id == Artist.id,
-        Show.start_time < datetime.now()
-    ).\
-    all()
-  upcoming_shows = db.session.query(Artist, Show).join(Show).join(Venue).\
-    filter(
-        Show.venue_id == venue_id,
-        Show.artist_id == Artist.id,
-        Show.start_time > datetime.now()
-    ).\
-    all()
-  venue = Venue.query.filter_by(id=venue_id).first_or_404()
-  data = venue.__dict__
-  data['past_shows'] = [{
-            'artist_id': artist.id,
-            "artist_name": artist.name,
-            "artist_image_link": artist.image_link,
-            "start_time": show.start_time.strftime("%m/%d/%Y, %H:%M")
-        } for artist, show in past_shows]
-
-  data['upcoming_shows'] = [{
-            'artist_id': artist.id,
-            'artist_name': artist.name,
-            'artist_image_link': artist.image_link,
-            'start_time': show.start_time.strftime("%m/%d/%Y, %H:%M")
-        } for artist, show in upcoming_shows]
-  data['past_shows_count'] = len(past_shows)
-  data['upcoming_shows_count'] = len(upcoming_shows)
-
-  return render_template('pages/show_venue.html', venue=venue)
+  fragment = fragment_cache.fragment('venue', venue_id, version, render)
+  return render_template('pages/show_venue.html', fragment=fragment)
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@route('/venues/create', methods=['GET'])
+@cache_policy(private=True)
 def create_venue_form():
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@route('/venues/create', methods=['POST'])
 def create_venue_submission():
   form = VenueForm(request.form, meta={'csrf': False})
   if form.validate():
@@ -157,9 +230,10 @@ def create_venue_submission():
     flash('Errors ' + str(message))
   return render_template('pages/home.html')
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   try:
+    delete_venue_shows(venue_id)
     Venue.query.filter_by(id=venue_id).delete()
     db.session.commit()
   except Exception as e:
@@ -176,63 +250,52 @@ def delete_venue(venue_id):
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@route('/artists')
+@cache_policy(depends=['Artist'])
 def artists():
-  # replaces with real data returned from querying the database
-  data=Artist.query.all()
-  return render_template('pages/artists.html', artists=data)
-
-@app.route('/artists/search', methods=['POST'])
+  # one page of (id, name, upcoming count) rows, never whole Artist objects
+  letter = normalize_letter(request.args.get('letter'))
+  page = artist_directory(
+      page=request.args.get('page', 1, type=int),
+      per_page=current_app.config['ARTISTS_PER_PAGE'],
+      letter=letter
+  )
+  return render_template('pages/artists.html', artists=page.items, page=page, letter=letter, letters=LETTERS)
+
+@route('/artists/search', methods=['GET', 'POST'])
+@cache_policy(depends=['Artist'])
 def search_artists():
-  # implement search on artists with partial string search. Ensure it is case-insensitive.
-  search_term=request.form.get('search_term', '')
-  # implement search on artists with partial string search. Ensure it is case-insensitive.
-  
-  result = Artist.query.filter(Artist.name.ilike('%' + search_term + '%')).all()
-  response = {"count": len(result), "data": result}
-	
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/artists/<int:artist_id>')
+  # ranked partial, case-insensitive search on name, city, state and genres
+  search_term = request.values.get('search_term', '')
+  page = search.search_artists(
+      search_term,
+      page=request.args.get('page', 1, type=int),
+      per_page=current_app.config['SEARCH_PAGE_SIZE']
+  )
+  response = {"count": page.total, "data": page.items}
+  return render_template('pages/search_artists.html', results=response, page=page, search_term=search_term)
+
+@route('/artists/<int:artist_id>')
+@cache_policy(depends=['Artist', 'Venue', 'Show'])
 def show_artist(artist_id):
-    
-  past_shows = db.session.query(Venue, Show).join(Show).join(Artist).\
-    filter(
-        Show.venue_id == Venue.id,
-        Show.artist_id == artist_id,
-        Show.start_time < datetime.now()
-    ).\
-    all()
-  upcoming_shows = db.session.query(Venue, Show).join(Show).join(Artist).\
-    filter(
-        Show.venue_id == Venue.id,
-        Show.artist_id == artist_id,
-        Show.start_time > datetime.now()
-    ).\
-    all()
-  artist = Artist.query.filter_by(id=artist_id).first_or_404()
-  data = artist.__dict__
-  data['past_shows'] = [{
-            'venue_id': venue.id,
-            "venue_name": venue.name,
-            "venue_image_link": venue.image_link,
-            "start_time": show.start_time.strftime("%m/%d/%Y, %H:%M")
-        } for venue, show in past_shows]
-
-  data['upcoming_shows'] = [{
-            'venue_id': venue.id,
-            'venue_name': venue.name,
-            'venue_image_link': venue.image_link,
-            'start_time': show.start_time.strftime("%m/%d/%Y, %H:%M")
-        } for venue, show in upcoming_shows]
-  data['past_shows_count'] = len(past_shows)
-  data['upcoming_shows_count'] = len(upcoming_shows)
-  
-  return render_template('pages/show_artist.html', artist=artist)
+  # the cached fragment is keyed by the row version, a primary key lookup
+  header = db.session.query(Artist.name, Artist.version).filter_by(id=artist_id).first()
+  if header is None:
+    abort(404)
+
+  def render():
+    artist = artist_detail(artist_id)
+    if artist is None:
+      abort(404)
+    return render_template('fragments/artist.html', artist=artist)
+
+  fragment = fragment_cache.fragment('artist', artist_id, header.version, render)
+  return render_template('pages/show_artist.html', fragment=fragment, name=header.name)
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@route('/artists/<int:artist_id>/edit', methods=['GET'])
+@cache_policy(private=True)
 def edit_artist(artist_id):
   
   artist = Artist.query.get(artist_id)
@@ -242,18 +305,21 @@ def edit_artist(artist_id):
     
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   
+  artist = Artist.query.get_or_404(artist_id)
   form = ArtistForm(request.form, meta={'csrf': False})
   if form.validate():
     try:
-      artist = Artist()
       form.populate_obj(artist)
+      # the version_id_col bumps the artist; its venues show its name
+      touch_venues_of_artist(artist_id)
+      update_artist_upcoming(artist)
       db.session.commit()
       flash('Artist ' + request.form['name'] + ' was successfully edited!')
     except Exception as err:
-      flash('Artist' + data['name'] + 'could not be saved!', 'error')
+      flash('Artist ' + request.form['name'] + ' could not be saved!', 'error')
       logging.error(err)
       db.session.rollback()
     finally:
@@ -265,7 +331,8 @@ def edit_artist_submission(artist_id):
     flash('Errors ' + str(message))
   return redirect(url_for('show_artist', artist_id=artist_id))
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@route('/venues/<int:venue_id>/edit', methods=['GET'])
+@cache_policy(private=True)
 def edit_venue(venue_id):
   venue = Venue.query.get(venue_id)
   form = VenueForm(obj=venue)
@@ -274,20 +341,26 @@ def edit_venue(venue_id):
   
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   # takes values from the form submitted, and update existing
   # venue record with ID <venue_id> using the new attributes
+  venue = Venue.query.get_or_404(venue_id)
   form = VenueForm(request.form, meta={'csrf': False})
   if form.validate():
     try:
-      venue = Venue()
+      place = (venue.city, venue.state)
       form.populate_obj(venue)
+      if (venue.city, venue.state) != place:
+        forget_location(venue)
+      # the version_id_col bumps the venue; its artists show its name
+      touch_artists_of_venue(venue_id)
+      update_venue_upcoming(venue)
       db.session.commit()
       flash('Venue ' + request.form['name'] + ' was successfully edited!')
     except Exception as err:
       logging.error(err)
-      flash('Venue' + data['name'] + 'could not be saved!', 'error')
+      flash('Venue ' + request.form['name'] + ' could not be saved!', 'error')
       db.session.rollback()
     finally:
       db.session.close()
@@ -301,12 +374,13 @@ def edit_venue_submission(venue_id):
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@route('/artists/create', methods=['GET'])
+@cache_policy(private=True)
 def create_artist_form():
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # called upon submitting the new artist listing form
   form = ArtistForm(request.form, meta={'csrf': False})
@@ -332,44 +406,124 @@ def create_artist_submission():
   return render_template('pages/home.html')
 
 
+#  Genres
+#  ----------------------------------------------------------------
+
+def genre_filters():
+  # ?state=CA&seeking=1; an unknown state lists every state
+  state = request.args.get('state', '').upper()
+  return (state if state in dict(state_choices) else None), request.args.get('seeking') == '1'
+
+@route('/genres')
+@cache_policy(depends=['Venue', 'Artist'])
+def genres():
+  # every genre with its number of venues and artists
+  state, seeking = genre_filters()
+  venues = genre_counts('venues', state, seeking)
+  artists = genre_counts('artists', state, seeking)
+  counts = [(genre, venues.get(genre, 0), artists.get(genre, 0)) for genre, label in genre_choices]
+  return render_template('pages/genres.html', counts=counts, states=state_choices, state=state, seeking=seeking)
+
+@route('/genres/<genre>/<any(venues, artists):kind>')
+@cache_policy(depends=['Venue', 'Artist'])
+def browse_genre(genre, kind):
+  genre = search.GENRES.get(genre.lower())
+  if genre is None:
+    abort(404)
+  state, seeking = genre_filters()
+  page = genre_page(
+      kind,
+      genre,
+      page=request.args.get('page', 1, type=int),
+      per_page=current_app.config['GENRE_PAGE_SIZE'],
+      state=state,
+      seeking=seeking
+  )
+  return render_template('pages/genre.html', page=page, genre=genre, kind=kind, states=state_choices, state=state, seeking=seeking)
+
+
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@route('/shows')
+@cache_policy(depends=['Show', 'Venue', 'Artist'])
 def shows():
-  # displays list of shows at /shows
-  data = Show.query.join(Venue).join(Artist).all()
-  logging.error(data)  
-  return render_template('pages/shows.html', shows=data)
-
-@app.route('/shows/search', methods=['POST'])
+  # displays list of shows at /shows, one keyset page at a time
+  limit = min(
+      request.args.get('limit', current_app.config['SHOWS_PAGE_SIZE'], type=int),
+      current_app.config['SHOWS_MAX_PAGE_SIZE']
+  )
+  try:
+    feed = show_feed(
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        limit=max(limit, 1)
+    )
+  except ValueError:
+    abort(400)
+  return render_template('pages/shows.html', shows=feed.items, feed=feed)
+
+@route('/calendar')
+@route('/calendar/<any(day, week, month):view>')
+@cache_policy(depends=['UpcomingShow'])
+def calendar(view='week'):
+  # upcoming shows by day, week or month, read from the calendar table only
+  try:
+    day = datetime.strptime(request.args['date'], '%Y-%m-%d').date() if 'date' in request.args else datetime.now().date()
+  except ValueError:
+    abort(400)
+  first, last = calendar_range(view, day)
+  if view == 'day':
+    page = calendar_day(day, request.args.get('page', 1, type=int), current_app.config['CALENDAR_DAY_PAGE_SIZE'])
+    days = None
+  else:
+    page = None
+    days = calendar_days(first, last, current_app.config['CALENDAR_SHOWS_PER_DAY'])
+  return render_template(
+      'pages/calendar.html',
+      view=view,
+      day=day,
+      first=first,
+      last=last,
+      previous=first - timedelta(days=1),
+      following=last + timedelta(days=1),
+      days=days,
+      page=page
+  )
+
+@route('/shows/search', methods=['GET', 'POST'])
+@cache_policy(depends=['Show', 'Venue', 'Artist'])
 def search_shows():
-  # implement search on artists with partial string search. Ensure it is case-insensitive.
-  search_term=request.form.get('search_term', '')
-  # implement search on artists with partial string search. Ensure it is case-insensitive.
-  
-  result = Show.query.join(Artist).join(Venue).filter(Artist.name.ilike('%' + search_term + '%') | Venue.name.ilike('%' + search_term + '%')).distinct().all()
-  response = {"count": len(result), "data": result}
-	
-  return render_template('pages/search_shows.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/shows/create')
+  # ranked search on the artist and venue of each show
+  search_term = request.values.get('search_term', '')
+  page = search.search_shows(
+      search_term,
+      page=request.args.get('page', 1, type=int),
+      per_page=current_app.config['SEARCH_PAGE_SIZE']
+  )
+  response = {"count": page.total, "data": page.items}
+  return render_template('pages/search_shows.html', results=response, page=page, search_term=search_term)
+
+@route('/shows/create')
+@cache_policy(private=True)
 def create_shows():
   # renders form. do not touch.
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@route('/shows/create', methods=['POST'])
 def create_show_submission():
-  form = ShowForm(request.form)
-
   try:
-    show = Show()
-    form.populate_obj(show)
-    db.session.add(show)
-    db.session.commit()
-		# on successful db insert, flash success
-    flash('Show was successfully listed!')
+    # a batch of one: the same checks for double bookings as the API
+    result = schedule_shows([request.form])
+    if result['scheduled']:
+      db.session.commit()
+      # on successful db insert, flash success
+      flash('Show was successfully listed!')
+    elif result['conflicts']:
+      flash('Show could not be listed: the %s is already booked at that time.' % result['conflicts'][0]['conflict'])
+    else:
+      flash('An error occurred. Show could not be listed.')
   except Exception as err:
 		# on unsuccessful db insert, flash an error.
 		# e.g., flash('An error occurred. Show could not be listed.')
@@ -380,36 +534,26 @@ def create_show_submission():
     db.session.close()
   return render_template('pages/home.html')
 
-@app.errorhandler(404)
+@errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
-
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    require_secret_key(create_app()).run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    require_secret_key(create_app()).run(host='0.0.0.0', port=port)
 '''
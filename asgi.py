@@ -0,0 +1,189 @@
+import re
+from datetime import datetime
+from urllib.parse import parse_qs
+
+from werkzeug.exceptions import NotFound
+from api import detail_etag, dumps, parse_fields, select_fields
+from app import create_app, require_secret_key
+
+#----------------------------------------------------------------------------#
+# Async serving mode.
+#----------------------------------------------------------------------------#
+
+# An optional ASGI entry point, e.g.
+#
+#   uvicorn asgi:application --workers 4
+#
+# The venue and artist detail endpoints of the JSON API are answered
+# natively with asyncpg: the entity and its shows are read in one query
+# (one round trip, one snapshot, as on the WSGI path) on a pooled
+# connection, and the worker's event loop keeps serving other requests
+# while it is in flight. Every other route, with its templates, runs
+# unchanged as the Flask WSGI app through asgiref's adapter. Needs the
+# optional asgiref and asyncpg packages (and an ASGI server such as
+# uvicorn); the pool is sized by the same DB_POOL_* settings as the
+# SQLAlchemy engine. Natively answered requests skip Flask's request hooks,
+# so they are not in /metrics or the query profiler.
+
+try:
+    import asyncpg
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:
+    raise RuntimeError('the async serving mode requires the asgiref and asyncpg packages')
+
+# the entity with one row per show, as queries._load_detail reads it; a
+# single statement, so a single round trip and a single snapshot
+DETAIL_SQL = '''
+    SELECT "%(table)s".*,
+           "%(other)s".id AS %(prefix)s_id, "%(other)s".name AS %(prefix)s_name,
+           "%(other)s".image_link AS %(prefix)s_image_link,
+           "Show".start_time, "Show".start_time > $2 AS is_upcoming
+    FROM "%(table)s"
+    LEFT JOIN "Show" ON "Show".%(key)s = "%(table)s".id
+    LEFT JOIN "%(other)s" ON "%(other)s".id = "Show".%(other_key)s
+    WHERE "%(table)s".id = $1
+    ORDER BY "Show".start_time
+'''
+
+DETAILS = {
+    'venues': {
+        'kind': 'venue',
+        'prefix': 'artist',
+        'version_sql': 'SELECT version FROM "Venue" WHERE id = $1',
+        'detail_sql': DETAIL_SQL % {
+            'table': 'Venue', 'key': 'venue_id',
+            'other': 'Artist', 'other_key': 'artist_id', 'prefix': 'artist',
+        },
+    },
+    'artists': {
+        'kind': 'artist',
+        'prefix': 'venue',
+        'version_sql': 'SELECT version FROM "Artist" WHERE id = $1',
+        'detail_sql': DETAIL_SQL % {
+            'table': 'Artist', 'key': 'artist_id',
+            'other': 'Venue', 'other_key': 'venue_id', 'prefix': 'venue',
+        },
+    },
+}
+
+DETAIL_PATH = re.compile(r'^/api/v1/(venues|artists)/(\d+)$')
+
+def _dsn(uri):
+    # asyncpg takes libpq URLs without SQLAlchemy's +driver suffix
+    scheme, rest = uri.split('://', 1)
+    return 'postgresql://' + rest if scheme.startswith('postgres') else uri
+
+class AsyncApp(object):
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.pool = None
+
+    async def startup(self):
+        config = self.flask_app.config
+        self.pool = await asyncpg.create_pool(
+            _dsn(config['SQLALCHEMY_DATABASE_URI']),
+            min_size=1,
+            max_size=config['DB_POOL_SIZE'] + config['DB_MAX_OVERFLOW'],
+            max_inactive_connection_lifetime=max(config['DB_POOL_RECYCLE'], 0),
+            server_settings={'statement_timeout': str(config['DB_STATEMENT_TIMEOUT'])},
+        )
+
+    async def shutdown(self):
+        if self.pool is not None:
+            await self.pool.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as err:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(err)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD') and self.pool is not None:
+            match = DETAIL_PATH.match(scope['path'])
+            if match:
+                return await self.detail(scope, send, DETAILS[match.group(1)], int(match.group(2)))
+        return await self.wsgi(scope, receive, send)
+
+    async def fetch(self, sql, *args):
+        async with self.pool.acquire() as connection:
+            return await connection.fetch(sql, *args)
+
+    async def load(self, detail, entity_id, now):
+        # the same view-model as queries.venue_detail/artist_detail
+        rows = await self.fetch(detail['detail_sql'], entity_id, now)
+        if not rows:
+            return None
+        prefix = detail['prefix']
+        show_columns = (prefix + '_id', prefix + '_name', prefix + '_image_link')
+        data = dict((key, value) for key, value in rows[0].items()
+                    if key not in show_columns + ('start_time', 'is_upcoming'))
+        data['past_shows'] = []
+        data['upcoming_shows'] = []
+        for row in rows:
+            if row['start_time'] is None:
+                continue
+            shows = data['upcoming_shows'] if row['is_upcoming'] else data['past_shows']
+            show = dict((key, row[key]) for key in show_columns)
+            show['start_time'] = row['start_time']
+            shows.append(show)
+        data['past_shows_count'] = len(data['past_shows'])
+        data['upcoming_shows_count'] = len(data['upcoming_shows'])
+        return data
+
+    async def detail(self, scope, send, detail, entity_id):
+        headers = dict((name.decode('latin-1').lower(), value.decode('latin-1'))
+                       for name, value in scope['headers'])
+        query = parse_qs(scope['query_string'].decode('latin-1'))
+        fields = parse_fields(query.get('fields', [None])[0])
+
+        if 'if-none-match' in headers:
+            # revalidation: the version alone decides, as in the WSGI app
+            rows = await self.fetch(detail['version_sql'], entity_id)
+            if rows:
+                etag = detail_etag(detail['kind'], entity_id, rows[0]['version'], fields)
+                if _etag_matches(headers['if-none-match'], etag):
+                    return await _respond(send, 304, etag=etag)
+
+        head = scope['method'] == 'HEAD'
+        data = await self.load(detail, entity_id, datetime.now())
+        if data is None:
+            body = dumps({'error': 404, 'message': NotFound.description})
+            return await _respond(send, 404, body, head=head)
+        etag = detail_etag(detail['kind'], entity_id, data['version'], fields)
+        return await _respond(send, 200, dumps(select_fields(data, fields)), etag, head)
+
+def _etag_matches(header, etag):
+    for value in header.split(','):
+        value = value.strip()
+        if value.startswith('W/'):
+            value = value[2:]
+        if value == '*' or value.strip('"') == etag:
+            return True
+    return False
+
+async def _respond(send, status, body=None, etag=None, head=False):
+    headers = []
+    content = (body or '').encode('utf-8')
+    if body is not None:
+        headers.append((b'content-type', b'application/json'))
+    headers.append((b'content-length', str(len(content)).encode('latin-1')))
+    if etag is not None:
+        headers.append((b'etag', ('"%s"' % etag).encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': b'' if head else content})
+
+application = AsyncApp(require_secret_key(create_app()))
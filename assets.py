@@ -0,0 +1,190 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup
+
+#----------------------------------------------------------------------------#
+# Static asset bundles.
+#----------------------------------------------------------------------------#
+
+# The stylesheets and scripts of layouts/main.html are served as three
+# bundles. `flask assets build` concatenates and minifies each one, names it
+# after a hash of its contents (main.3f9c1a2b.css), writes .gz and .br
+# copies next to it and records the names in static/dist/manifest.json.
+# Templates ask asset_urls() for a bundle's URLs: with a build that is the
+# fingerprinted file, served with an immutable far-future Cache-Control and
+# pre-compressed to match Accept-Encoding, so repeat visitors request no
+# assets at all; without one (development) it is the source files. Bundles
+# live one level below static/, like css/ and js/, so relative url()s in the
+# stylesheets still resolve. Minification uses rcssmin and rjsmin when
+# installed and brotli copies need the brotli package; without them the
+# build falls back to a conservative CSS minifier, unminified scripts and
+# gzip only.
+
+BUNDLES = {
+    # in <head>, before any page content
+    'main.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    # in <head>, blocking
+    'head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js',
+    ],
+    # deferred, after jQuery
+    'site.js': [
+        'js/script.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+    ],
+}
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+_CSS_COMMENT = re.compile(r'/\*(?!!).*?\*/', re.S)
+_CSS_SPACE = re.compile(r'\s+')
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+
+def minify_css(source):
+    if rcssmin is not None:
+        return rcssmin.cssmin(source)
+    # comments (keeping /*! licences */) and whitespace around punctuation;
+    # ':' is left alone, it is significant in selectors like `a :hover`
+    source = _CSS_COMMENT.sub('', source)
+    source = _CSS_SPACE.sub(' ', source)
+    return _CSS_PUNCTUATION.sub(r'\1', source).strip()
+
+def minify_js(source):
+    if rjsmin is not None:
+        return rjsmin.jsmin(source, keep_bang_comments=True)
+    return source
+
+def bundle(static_folder, name):
+    # the minified contents of a bundle
+    parts = []
+    for path in BUNDLES[name]:
+        with open(os.path.join(static_folder, path), encoding='utf-8') as source:
+            text = source.read()
+        if name.endswith('.css'):
+            parts.append(minify_css(text))
+        else:
+            # a newline and a semicolon keep each script's last statement
+            # apart from the next script
+            parts.append(minify_js(text).rstrip() + '\n;')
+    return '\n'.join(parts).encode('utf-8')
+
+def build(static_folder):
+    # writes every bundle with its compressed copies; returns the manifest
+    dist = os.path.join(static_folder, DIST)
+    os.makedirs(dist, exist_ok=True)
+    manifest = {}
+    for name in sorted(BUNDLES):
+        content = bundle(static_folder, name)
+        stem, extension = os.path.splitext(name)
+        filename = '%s.%s%s' % (stem, hashlib.sha256(content).hexdigest()[:12], extension)
+        path = os.path.join(dist, filename)
+        with open(path, 'wb') as output:
+            output.write(content)
+        # mtime=0 so rebuilding the same content gives the same bytes
+        with open(path + '.gz', 'wb') as output:
+            output.write(gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as output:
+                output.write(brotli.compress(content, quality=11))
+        manifest[name] = filename
+    with open(os.path.join(dist, MANIFEST), 'w') as output:
+        json.dump(manifest, output, indent=2, sort_keys=True)
+    return manifest
+
+class Assets(object):
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.max_age = 365 * 24 * 3600
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_age = app.config.get('ASSET_MAX_AGE', self.max_age)
+        self.manifest = self.load_manifest(app)
+        # more specific than /static/<path:filename>, so it wins for bundles
+        app.add_url_rule(app.static_url_path + '/' + DIST + '/<path:filename>',
+                         endpoint='assets', view_func=self.send_bundle)
+        app.jinja_env.globals['asset_urls'] = self.urls
+        app.extensions['assets'] = self
+
+    def load_manifest(self, app):
+        try:
+            with open(os.path.join(app.static_folder, DIST, MANIFEST)) as manifest:
+                return json.load(manifest)
+        except (OSError, ValueError):
+            return {}
+
+    def urls(self, name):
+        filename = self.manifest.get(name)
+        if filename is not None:
+            return [url_for('assets', filename=filename)]
+        return [url_for('static', filename=path) for path in BUNDLES[name]]
+
+    def send_bundle(self, filename):
+        directory = os.path.join(current_app.static_folder, DIST)
+        mimetype = mimetypes.guess_type(filename)[0]
+        encoding = None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[candidate] and os.path.isfile(os.path.join(directory, filename + suffix)):
+                encoding = candidate
+                filename += suffix
+                break
+        response = send_from_directory(directory, filename, mimetype=mimetype,
+                                       cache_timeout=self.max_age, conditional=True)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        # the name changes with the content: never revalidate
+        response.cache_control.public = True
+        response.cache_control.max_age = self.max_age
+        response.cache_control.immutable = True
+        return response
+
+assets = Assets()
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+assets_cli = AppGroup('assets', help='Build the static asset bundles.')
+
+@assets_cli.command('build')
+def build_command():
+    """Concatenate, minify, fingerprint and compress the bundles."""
+    manifest = build(current_app.static_folder)
+    for name, filename in sorted(manifest.items()):
+        click.echo('%s -> %s/%s' % (name, DIST, filename))
+    if brotli is None:
+        click.echo('brotli is not installed: only gzip copies were written')
@@ -0,0 +1,53 @@
+#----------------------------------------------------------------------------#
+# Datetime filter benchmark.
+#----------------------------------------------------------------------------#
+
+# Compares the original `datetime` Jinja filter with the precompiled,
+# memoized formatter over the start times of 10k shows.
+#
+#   python -m bench.datetime_filter --shows 10000
+
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from formatting import DateTimeFormatter
+
+def legacy_format_datetime(value, format='medium'):
+    # the filter as it was registered in app.py
+    date = dateutil.parser.parse(value) if isinstance(value, str) else value
+    if format == 'full':
+        format="EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format="EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+def clock(label, fn, baseline=None):
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    speedup = ' (%.1fx)' % (baseline / elapsed) if baseline else ''
+    print('%-32s %8.1fms%s' % (label, elapsed * 1000, speedup))
+    return result, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the datetime filter.')
+    parser.add_argument('--shows', type=int, default=10000)
+    parser.add_argument('--format', default='full')
+    args = parser.parse_args()
+
+    start = datetime(2021, 1, 1, 20, 0)
+    times = [start + timedelta(hours=i % 5000) for i in range(args.shows)]
+    formatter = DateTimeFormatter()
+
+    expected, baseline = clock('legacy filter', lambda: [legacy_format_datetime(t, args.format) for t in times])
+    cold, _ = clock('formatter, cold cache', lambda: [formatter.format(t, args.format) for t in times], baseline)
+    warm, _ = clock('formatter, warm cache', lambda: [formatter.format(t, args.format) for t in times], baseline)
+    bulk, _ = clock('formatter, bulk', lambda: formatter.format_many(times, args.format), baseline)
+    assert expected == cold == warm == bulk, 'formatter output differs from the legacy filter'
+
+if __name__ == '__main__':
+    main()
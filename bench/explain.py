@@ -0,0 +1,25 @@
+#----------------------------------------------------------------------------#
+# EXPLAIN helpers.
+#----------------------------------------------------------------------------#
+
+from sqlalchemy import event
+
+from models import db
+
+def capture(fn, *args):
+    # runs fn and returns the last SQL statement and parameters it issued
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        fn(*args)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return statements[-1]
+
+def explain(statement, parameters):
+    rows = db.session.connection().execute('EXPLAIN ANALYZE ' + statement, parameters)
+    return [row[0] for row in rows]
@@ -0,0 +1,296 @@
+#----------------------------------------------------------------------------#
+# Load test.
+#----------------------------------------------------------------------------#
+
+# Drives every read route of the site and the JSON API with concurrent
+# clients and records throughput and p50/p95/p99 latency per route. Results
+# are written as JSON tagged with the current commit, so two runs can be
+# compared and regressions caught:
+#
+#   python -m bench.seed --venues 10000 --artists 50000 --shows 1000000
+#   python -m bench.load run --output before.json
+#   git checkout other-branch
+#   python -m bench.load run --output after.json
+#   python -m bench.load compare before.json after.json --tolerance 10
+#
+# By default requests go through the WSGI app in process; --url sends them
+# over HTTP to a running server (e.g. gunicorn) instead. The queries rely on
+# Postgres (pg_trgm, array operators, data-modifying CTEs), so there is no
+# SQLite mode: seed a local Postgres. Write routes are left out so runs stay
+# repeatable on the same data.
+
+import argparse
+import http.client
+import json
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import quote, urlsplit
+
+from sqlalchemy import text
+
+from app import create_app
+from bench.seed import CITIES, LOCATIONS, NOUNS, WORDS, seed
+from forms import genre_choices
+from models import db
+from queries import LETTERS
+
+app = create_app({'SECRET_KEY': 'bench'})
+
+# (name, path); {placeholders} are filled per request from sampled data
+SCENARIOS = [
+    ('index', '/'),
+    ('venues', '/venues'),
+    ('venues_letter', '/venues?letter={letter}&page={page}'),
+    ('search_venues', '/venues/search?search_term={term}'),
+    ('show_venue', '/venues/{venue_id}'),
+    ('create_venue_form', '/venues/create'),
+    ('edit_venue', '/venues/{venue_id}/edit'),
+    ('artists', '/artists'),
+    ('artists_letter', '/artists?letter={letter}&page={page}'),
+    ('search_artists', '/artists/search?search_term={term}'),
+    ('show_artist', '/artists/{artist_id}'),
+    ('create_artist_form', '/artists/create'),
+    ('edit_artist', '/artists/{artist_id}/edit'),
+    ('shows', '/shows'),
+    ('search_shows', '/shows/search?search_term={term}'),
+    ('create_shows', '/shows/create'),
+    ('calendar', '/calendar'),
+    ('calendar_day_view', '/calendar/day'),
+    ('calendar_month_view', '/calendar/month'),
+    ('genres', '/genres'),
+    ('browse_genre', '/genres/{genre}/venues?page={page}'),
+    ('browse_genre_state', '/genres/{genre}/artists?state={state}&seeking=1'),
+    ('api.venues', '/api/v1/venues?letter={letter}'),
+    ('api.search_venues', '/api/v1/venues/search?q={term}'),
+    ('api.show_venue', '/api/v1/venues/{venue_id}'),
+    ('api.nearby', '/api/v1/venues/nearby?lat={location[0]}&lng={location[1]}&miles=25'),
+    ('api.artists', '/api/v1/artists?letter={letter}'),
+    ('api.search_artists', '/api/v1/artists/search?q={term}'),
+    ('api.show_artist', '/api/v1/artists/{artist_id}'),
+    ('api.shows', '/api/v1/shows'),
+    ('api.search_shows', '/api/v1/shows/search?q={term}'),
+    ('api.show', '/api/v1/shows/{show_id}'),
+]
+
+# GET endpoints deliberately not driven: bulk dumps, metrics and files
+SKIPPED = ('api.export', 'metrics.prometheus', 'metrics.pool_metrics', 'static', 'assets')
+
+def uncovered_endpoints():
+    # GET endpoints of the app without a scenario, so new routes are noticed
+    covered = set(name.split('_letter')[0] for name, path in SCENARIOS)
+    return sorted(
+        rule.endpoint for rule in app.url_map.iter_rules()
+        if 'GET' in rule.methods and rule.endpoint not in covered and rule.endpoint not in SKIPPED
+    )
+
+def sample(table, count, seed):
+    # a reproducible sample of ids: setseed() fixes random() for the session
+    db.session.execute(text('SELECT setseed(:seed)'), {'seed': seed})
+    ids = [id for id, in db.session.execute(
+        text('SELECT id FROM "%s" ORDER BY random() LIMIT :count' % table), {'count': count})]
+    if not ids:
+        raise SystemExit('no rows in %s: seed the database first (python -m bench.seed)' % table)
+    return ids
+
+class Workload(object):
+    # fills each scenario's path from sampled ids and search terms
+
+    def __init__(self, seed=0, ids=500):
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        with app.app_context():
+            self.values = {
+                'venue_id': sample('Venue', ids, 0.5),
+                'artist_id': sample('Artist', ids, 0.5),
+                'show_id': sample('Show', ids, 0.5),
+            }
+            db.session.remove()
+        self.values['letter'] = list(LETTERS)
+        self.values['page'] = [1, 2, 3]
+        self.values['genre'] = [quote(genre, safe='') for genre, label in genre_choices]
+        self.values['state'] = [state for city, state in CITIES]
+        self.values['location'] = LOCATIONS
+        self.values['term'] = [quote(term) for term in
+                               WORDS + NOUNS + ['%s, %s' % pair for pair in CITIES]]
+
+    def path(self, template):
+        with self.lock:
+            return template.format(**dict(
+                (key, self.random.choice(values)) for key, values in self.values.items()
+            ))
+
+class WSGIClient(object):
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def get(self, path):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = app.test_client()
+        response = client.get(path)
+        response.get_data()
+        return response.status_code
+
+class HTTPClient(object):
+    # one keep-alive connection per client thread
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.local = threading.local()
+
+    def get(self, path):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection(self.host, self.port)
+        try:
+            connection.request('GET', self.prefix + path)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            self.local.connection = None
+            raise
+
+def percentile(ordered, fraction):
+    # nearest rank on an already sorted list
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+def drive(client, workload, template, requests, concurrency):
+    latencies = []
+    errors = []
+
+    def one(_):
+        path = workload.path(template)
+        started = time.perf_counter()
+        try:
+            status = client.get(path)
+        except Exception as err:
+            errors.append('%s: %s' % (path, err))
+            return
+        latencies.append(time.perf_counter() - started)
+        if status >= 400:
+            errors.append('%s: HTTP %d' % (path, status))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': len(errors),
+        'error_samples': errors[:5],
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, .50) * 1000, 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, .95) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, .99) * 1000, 2) if latencies else None,
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else None,
+    }
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD']).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    if args.seed:
+        with app.app_context():
+            seed(args.venues, args.artists, args.shows)
+    for endpoint in uncovered_endpoints():
+        print('warning: no scenario for GET endpoint %s' % endpoint, file=sys.stderr)
+    workload = Workload(args.random_seed)
+    client = HTTPClient(args.url) if args.url else WSGIClient()
+    scenarios = [(name, path) for name, path in SCENARIOS
+                 if not args.only or name in args.only]
+
+    # one untimed pass warms caches, the pool and the formatter
+    for name, path in scenarios:
+        drive(client, workload, path, args.warmup, args.concurrency)
+
+    routes = {}
+    for name, path in scenarios:
+        routes[name] = result = drive(client, workload, path, args.requests, args.concurrency)
+        print('%-20s %8.1f req/s  p50 %7.1fms  p95 %7.1fms  p99 %7.1fms  %d errors' % (
+            name, result['throughput_rps'], result['p50_ms'] or 0, result['p95_ms'] or 0,
+            result['p99_ms'] or 0, result['errors']))
+
+    report = {
+        'commit': commit(),
+        'created': datetime.utcnow().isoformat() + 'Z',
+        'target': args.url or 'wsgi',
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'routes': routes,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+        print('results written to %s' % args.output)
+    return 1 if any(result['errors'] for result in routes.values()) else 0
+
+def compare(args):
+    # fails when a route's p95 grew, or its throughput fell, by more than
+    # the tolerance
+    with open(args.before) as before_file, open(args.after) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+    print('%s -> %s' % (before.get('commit'), after.get('commit')))
+    regressions = []
+    for name in sorted(set(before['routes']) & set(after['routes'])):
+        old, new = before['routes'][name], after['routes'][name]
+        if not old['p95_ms'] or not new['p95_ms'] or not old['throughput_rps']:
+            continue
+        p95 = (new['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100
+        rps = (new['throughput_rps'] - old['throughput_rps']) / old['throughput_rps'] * 100
+        flag = ''
+        if p95 > args.tolerance or -rps > args.tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('%-20s p95 %7.1fms -> %7.1fms (%+6.1f%%)  %8.1f -> %8.1f req/s (%+6.1f%%)%s' % (
+            name, old['p95_ms'], new['p95_ms'], p95,
+            old['throughput_rps'], new['throughput_rps'], rps, flag))
+    return 1 if regressions else 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test every Fyyur route.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run_parser = commands.add_parser('run', help='drive the routes and record results')
+    run_parser.add_argument('--url', help='base URL of a running server; default: in-process WSGI')
+    run_parser.add_argument('--requests', type=int, default=200, help='timed requests per route')
+    run_parser.add_argument('--warmup', type=int, default=20, help='untimed requests per route')
+    run_parser.add_argument('--concurrency', type=int, default=8)
+    run_parser.add_argument('--only', nargs='+', help='scenario names to run')
+    run_parser.add_argument('--random-seed', type=int, default=0)
+    run_parser.add_argument('--output', help='write JSON results here')
+    run_parser.add_argument('--seed', action='store_true', help='seed the database first')
+    run_parser.add_argument('--venues', type=int, default=10000)
+    run_parser.add_argument('--artists', type=int, default=50000)
+    run_parser.add_argument('--shows', type=int, default=1000000)
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.add_argument('--tolerance', type=float, default=10.0,
+                                help='percent change allowed before a route counts as a regression')
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args()
+    sys.exit(args.handler(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#----------------------------------------------------------------------------#
+# Search plans.
+#----------------------------------------------------------------------------#
+
+# Checks that the venue, artist and show searches are answered from the
+# trigram indexes rather than sequential scans, and reports their latency.
+# Seed at least 100k rows first (python -m bench.seed), then:
+#
+#   python -m bench.search_plans --terms "blue" "San Francisco, CA" "Jazz"
+
+import argparse
+import statistics
+import sys
+import time
+
+import search
+from app import create_app
+from bench.explain import capture, explain
+
+SEARCHES = [
+    ('venues', search.search_venues, ['Venue']),
+    ('artists', search.search_artists, ['Artist']),
+    ('shows', search.search_shows, ['Artist', 'Venue', 'Show']),
+]
+
+def timings(fn, term, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.time()
+        fn(term)
+        samples.append((time.time() - started) * 1000)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description='Explain and time Fyyur searches.')
+    parser.add_argument('--terms', nargs='+', default=['blue', 'San Francisco, CA', 'Jazz'])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--budget-ms', type=float, default=50.0,
+                        help='fail if the median latency of any search exceeds this')
+    args = parser.parse_args()
+
+    failures = []
+    with create_app({'SECRET_KEY': 'bench'}).app_context():
+        for label, fn, tables in SEARCHES:
+            for term in args.terms:
+                plan = explain(*capture(fn, term))
+                samples = timings(fn, term, args.repeat)
+                median = statistics.median(samples)
+                print('== %s %r: median %.1fms, max %.1fms' % (label, term, median, max(samples)))
+                print('\n'.join('   ' + line for line in plan))
+                for table in tables:
+                    if any('Seq Scan on "%s"' % table in line for line in plan):
+                        failures.append('%s %r: sequential scan on %s' % (label, term, table))
+                if median > args.budget_ms:
+                    failures.append('%s %r: median %.1fms over budget' % (label, term, median))
+
+    for failure in failures:
+        print('FAIL ' + failure)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
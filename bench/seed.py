@@ -0,0 +1,162 @@
+#----------------------------------------------------------------------------#
+# Benchmark data.
+#----------------------------------------------------------------------------#
+
+# Seeds the configured Postgres database with synthetic venues, artists and
+# shows. Rows are generated server side with generate_series, so a million
+# shows load in seconds rather than minutes. The bookkeeping the app keeps
+# on every write (show counters, counted_as_past and the upcoming shows
+# calendar) is then rebuilt in bulk, as `flask counters rebuild` and
+# `flask calendar rebuild` would.
+#
+#   python -m bench.seed --venues 10000 --artists 50000 --shows 1000000
+
+import argparse
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+import counters
+import upcoming
+from app import create_app
+from forms import genre_choices
+from models import db
+
+CITIES = [
+    ('San Francisco', 'CA'), ('Oakland', 'CA'), ('Los Angeles', 'CA'),
+    ('New York', 'NY'), ('Brooklyn', 'NY'), ('Austin', 'TX'),
+    ('Houston', 'TX'), ('Chicago', 'IL'), ('Seattle', 'WA'),
+    ('Portland', 'OR'), ('Denver', 'CO'), ('Nashville', 'TN'),
+    ('New Orleans', 'LA'), ('Atlanta', 'GA'), ('Miami', 'FL'),
+    ('Boston', 'MA'), ('Detroit', 'MI'), ('Minneapolis', 'MN'),
+]
+
+# (latitude, longitude) of each of CITIES
+LOCATIONS = [
+    (37.7749, -122.4194), (37.8044, -122.2712), (34.0522, -118.2437),
+    (40.7128, -74.0060), (40.6782, -73.9442), (30.2672, -97.7431),
+    (29.7604, -95.3698), (41.8781, -87.6298), (47.6062, -122.3321),
+    (45.5152, -122.6784), (39.7392, -104.9903), (36.1627, -86.7816),
+    (29.9511, -90.0715), (33.7490, -84.3880), (25.7617, -80.1918),
+    (42.3601, -71.0589), (42.3314, -83.0458), (44.9778, -93.2650),
+]
+
+WORDS = [
+    'Blue', 'Red', 'Golden', 'Electric', 'Velvet', 'Midnight', 'Silver',
+    'Wild', 'Lucky', 'Iron', 'Crystal', 'Neon', 'Rusty', 'Royal', 'Hidden',
+    'Broken', 'Little', 'Grand', 'Lonely', 'Rolling',
+]
+
+NOUNS = [
+    'Hall', 'Room', 'Tavern', 'Lounge', 'Club', 'Garden', 'Theatre',
+    'Cellar', 'Saloon', 'Barn', 'Stage', 'Den', 'Palace', 'Pub',
+]
+
+def _array(values):
+    return 'ARRAY[%s]' % ', '.join("'%s'" % value.replace("'", "''") for value in values)
+
+def _pick(values, expression):
+    # pick a deterministic element of a literal array for row i
+    return '(%s)[1 + (%s) %% %d]' % (_array(values), expression, len(values))
+
+def seed_venues(count):
+    db.session.execute(text('''
+        INSERT INTO "Venue" (name, city, state, address, latitude, longitude,
+                             genres, phone, image_link, facebook_link, website,
+                             seeking_talent, seeking_description)
+        SELECT %(word)s || ' ' || %(noun)s || ' ' || i,
+               %(city)s, %(state)s,
+               i || ' Main Street',
+               -- scattered up to ~0.1 degrees around the city centre
+               (%(latitude)s)::float8 + ((i * 7919) %% 1000 - 500) / 5000.0,
+               (%(longitude)s)::float8 + ((i * 104729) %% 1000 - 500) / 5000.0,
+               ARRAY[%(genre)s, %(other_genre)s],
+               '555-555-' || lpad((i %% 10000)::text, 4, '0'),
+               'https://example.com/venues/' || i || '.jpg',
+               'https://www.facebook.com/venue' || i,
+               'https://example.com/venues/' || i,
+               i %% 3 = 0,
+               'Looking for local talent'
+        FROM generate_series(1, :count) AS i
+    ''' % {
+        'word': _pick(WORDS, 'i'),
+        'noun': _pick(NOUNS, 'i / 7'),
+        'city': _pick([city for city, state in CITIES], 'i'),
+        'state': _pick([state for city, state in CITIES], 'i'),
+        'latitude': _pick([str(latitude) for latitude, longitude in LOCATIONS], 'i'),
+        'longitude': _pick([str(longitude) for latitude, longitude in LOCATIONS], 'i'),
+        'genre': _pick([value for value, label in genre_choices], 'i'),
+        'other_genre': _pick([value for value, label in genre_choices], 'i / 5'),
+    }), {'count': count})
+
+def seed_artists(count):
+    db.session.execute(text('''
+        INSERT INTO "Artist" (name, city, state, phone, genres, image_link,
+                              facebook_link, website, seeking_venue,
+                              seeking_description)
+        SELECT 'The ' || %(word)s || ' ' || %(noun)s || 's ' || i,
+               %(city)s, %(state)s,
+               '555-555-' || lpad((i %% 10000)::text, 4, '0'),
+               ARRAY[%(genre)s],
+               'https://example.com/artists/' || i || '.jpg',
+               'https://www.facebook.com/artist' || i,
+               'https://example.com/artists/' || i,
+               i %% 2 = 0,
+               'Looking for shows'
+        FROM generate_series(1, :count) AS i
+    ''' % {
+        'word': _pick(WORDS, 'i / 3'),
+        'noun': _pick(NOUNS, 'i'),
+        'city': _pick([city for city, state in CITIES], 'i / 2'),
+        'state': _pick([state for city, state in CITIES], 'i / 2'),
+        'genre': _pick([value for value, label in genre_choices], 'i'),
+    }), {'count': count})
+
+def seed_shows(count, days=730):
+    # shows are spread evenly over `days` days centred on now, so roughly
+    # half are past and half upcoming
+    db.session.execute(text('''
+        INSERT INTO "Show" (artist_id, venue_id, start_time)
+        SELECT artists.ids[1 + (i * 7919) % array_length(artists.ids, 1)],
+               venues.ids[1 + (i * 104729) % array_length(venues.ids, 1)],
+               date_trunc('hour', now()::timestamp)
+                 + ((i % (:days * 24)) - :days * 12) * interval '1 hour'
+        FROM generate_series(1, :count) AS i,
+             (SELECT array_agg(id) AS ids FROM "Artist") AS artists,
+             (SELECT array_agg(id) AS ids FROM "Venue") AS venues
+    '''), {'count': count, 'days': days})
+
+def seed(venues=0, artists=0, shows=0):
+    for label, count, loader in (
+        ('venues', venues, seed_venues),
+        ('artists', artists, seed_artists),
+        ('shows', shows, seed_shows),
+    ):
+        if not count:
+            continue
+        started = time.time()
+        loader(count)
+        db.session.commit()
+        print('seeded %d %s in %.1fs' % (count, label, time.time() - started))
+    if venues or artists or shows:
+        started = time.time()
+        now = datetime.now()
+        counters.rebuild_counters(now)
+        upcoming.rebuild_upcoming(now)
+        db.session.commit()
+        print('rebuilt counters and calendar in %.1fs' % (time.time() - started))
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed Fyyur with benchmark data.')
+    parser.add_argument('--venues', type=int, default=10000)
+    parser.add_argument('--artists', type=int, default=50000)
+    parser.add_argument('--shows', type=int, default=1000000)
+    args = parser.parse_args()
+    with create_app({'SECRET_KEY': 'bench'}).app_context():
+        seed(args.venues, args.artists, args.shows)
+
+if __name__ == '__main__':
+    main()
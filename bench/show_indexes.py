@@ -0,0 +1,95 @@
+#----------------------------------------------------------------------------#
+# Show index benchmark.
+#----------------------------------------------------------------------------#
+
+# Reports EXPLAIN ANALYZE timings for the venue and artist detail pages and
+# the venue delete cascade with and without the composite Show indexes.
+# The "before" numbers drop the indexes inside a transaction that is rolled
+# back, so the database is left untouched.
+#
+#   python -m bench.show_indexes --seed --shows 1000000
+
+import argparse
+import re
+
+from sqlalchemy import text
+
+from app import create_app
+from bench.explain import capture, explain
+from bench.seed import seed
+from models import db, Venue
+from queries import venue_detail, artist_detail
+
+INDEXES = [
+    'ix_Show_venue_id_start_time',
+    'ix_Show_artist_id_start_time',
+]
+
+def busiest(column):
+    return db.session.execute(text(
+        'SELECT %s FROM "Show" GROUP BY %s ORDER BY count(*) DESC LIMIT 1' % (column, column)
+    )).scalar()
+
+def delete_venue(venue_id):
+    Venue.query.filter_by(id=venue_id).delete()
+
+def timing(plan):
+    # execution time plus any foreign key trigger time (the delete cascade)
+    total = 0.0
+    for line in plan:
+        match = re.search(r'Execution Time: ([\d.]+) ms', line) or \
+          re.search(r'Trigger for constraint .*: time=([\d.]+)', line)
+        if match:
+            total += float(match.group(1))
+    return total
+
+def measure(cases, repeat):
+    # each run sits in a savepoint so the delete has the same rows every time
+    results = {}
+    for label, statement, parameters in cases:
+        samples = []
+        for _ in range(repeat):
+            savepoint = db.session.begin_nested()
+            samples.append(timing(explain(statement, parameters)))
+            savepoint.rollback()
+        results[label] = min(samples)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the composite Show indexes.')
+    parser.add_argument('--seed', action='store_true', help='seed benchmark data first')
+    parser.add_argument('--shows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with create_app({'SECRET_KEY': 'bench'}).app_context():
+        if args.seed:
+            seed(venues=10000, artists=50000, shows=args.shows)
+
+        venue_id = busiest('venue_id')
+        artist_id = busiest('artist_id')
+        cases = []
+        for label, fn, entity_id in (
+            ('show_venue', venue_detail, venue_id),
+            ('show_artist', artist_detail, artist_id),
+            ('delete_venue', delete_venue, venue_id),
+        ):
+            cases.append((label,) + capture(fn, entity_id))
+            db.session.rollback()
+
+        for index in INDEXES:
+            db.session.execute(text('DROP INDEX "%s"' % index))
+        before = measure(cases, args.repeat)
+        db.session.rollback()
+
+        after = measure(cases, args.repeat)
+        db.session.rollback()
+
+    print('%-14s %12s %12s %9s' % ('query', 'before (ms)', 'after (ms)', 'speedup'))
+    for label, statement, parameters in cases:
+        print('%-14s %12.2f %12.2f %8.1fx' % (
+            label, before[label], after[label], before[label] / max(after[label], 0.001)
+        ))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#----------------------------------------------------------------------------#
+# Startup benchmark.
+#----------------------------------------------------------------------------#
+
+# Starts gunicorn with and without --preload and reports how long it takes
+# until every worker is serving, and the memory of the master plus workers:
+# RSS counts shared pages once per process, PSS splits them between the
+# processes sharing them, so the PSS total shows what preloading saves.
+# Linux only (reads /proc).
+#
+#   SECRET_KEY=bench python -m bench.startup --workers 4
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import time
+
+def children(pid):
+    try:
+        with open('/proc/%d/task/%d/children' % (pid, pid)) as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+def memory(pid):
+    # (rss, pss) in kB
+    values = {}
+    with open('/proc/%d/smaps_rollup' % pid) as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:'):
+                values[parts[0]] = int(parts[1])
+    return values['Rss:'], values['Pss:']
+
+def serving(port):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+    try:
+        connection.request('GET', '/')
+        connection.getresponse().read()
+        return True
+    except (OSError, http.client.HTTPException):
+        return False
+    finally:
+        connection.close()
+
+def measure(preload, workers, port, requests):
+    command = [
+        sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+        '--workers', str(workers), '--bind', '127.0.0.1:%d' % port, 'wsgi:application',
+    ]
+    env = dict(os.environ, GUNICORN_PRELOAD='1' if preload else '0')
+    env.setdefault('SECRET_KEY', 'bench')
+    started = time.time()
+    master = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while len(children(master.pid)) < workers or not serving(port):
+            if master.poll() is not None:
+                raise SystemExit('gunicorn exited with status %d' % master.returncode)
+            time.sleep(0.02)
+        ready = time.time() - started
+        # touch every worker so each has rendered pages, as under traffic
+        for _ in range(requests):
+            serving(port)
+        pids = [master.pid] + children(master.pid)
+        usage = [memory(pid) for pid in pids]
+        return {
+            'preload': preload,
+            'workers': workers,
+            'ready_seconds': round(ready, 3),
+            'rss_kb': sum(rss for rss, pss in usage),
+            'pss_kb': sum(pss for rss, pss in usage),
+        }
+    finally:
+        master.terminate()
+        master.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure gunicorn startup with and without --preload.')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--requests', type=int, default=50,
+                        help='requests sent before memory is read')
+    parser.add_argument('--output', help='write JSON results here')
+    args = parser.parse_args()
+
+    results = [measure(preload, args.workers, args.port, args.requests) for preload in (False, True)]
+    for result in results:
+        print('%-12s ready in %6.2fs  RSS %8.1f MB  PSS %8.1f MB' % (
+            'preload' if result['preload'] else 'no preload', result['ready_seconds'],
+            result['rss_kb'] / 1024.0, result['pss_kb'] / 1024.0))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import OrderedDict
+
+from markupsafe import Markup
+from metrics import CACHE_LOOKUPS
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Backends.
+#----------------------------------------------------------------------------#
+
+class LRUCache(object):
+    # in-process, thread-safe LRU with a per-entry time to live
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+        }
+
+class RedisCache(object):
+    # shared cache on a local Redis (or Redis-compatible) server; needs the
+    # optional `redis` package
+
+    def __init__(self, url, ttl=300, prefix='fyyur:fragment:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('FRAGMENT_CACHE_TYPE = "redis" requires the redis package')
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key):
+        return self.prefix + ':'.join(str(part) for part in key)
+
+    def get(self, key):
+        value = self.client.get(self._key(key))
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value.decode('utf-8')
+
+    def set(self, key, value):
+        self.client.set(self._key(key), value.encode('utf-8'), ex=self.ttl)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+    def stats(self):
+        # evictions are counted server wide by Redis itself
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.client.info('stats').get('evicted_keys', 0),
+        }
+
+class NullCache(object):
+    # caching disabled: every lookup misses
+
+    def __init__(self):
+        self.misses = 0
+
+    def get(self, key):
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'hits': 0, 'misses': self.misses, 'evictions': 0}
+
+#----------------------------------------------------------------------------#
+# Fragment cache.
+#----------------------------------------------------------------------------#
+
+class FragmentCache(object):
+    # Caches rendered page fragments keyed by (kind, entity id, version).
+    # Writes bump the entity's version column instead of deleting entries,
+    # so every worker sees the change on its next lookup and stale
+    # fragments simply age out.
+
+    def __init__(self, app=None):
+        self.backend = NullCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        kind = app.config.get('FRAGMENT_CACHE_TYPE', 'lru')
+        ttl = app.config.get('FRAGMENT_CACHE_TTL', 300)
+        if kind == 'lru':
+            self.backend = LRUCache(app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 1024), ttl)
+        elif kind == 'redis':
+            self.backend = RedisCache(app.config['FRAGMENT_CACHE_URL'], ttl)
+        elif kind == 'null':
+            self.backend = NullCache()
+        else:
+            raise ValueError('unknown FRAGMENT_CACHE_TYPE %r' % kind)
+        app.extensions['fragment_cache'] = self
+
+    def fragment(self, kind, entity_id, version, render):
+        # returns the cached fragment, calling render() to fill a miss
+        key = (kind, entity_id, version)
+        html = self.backend.get(key)
+        CACHE_LOOKUPS.labels('fragment', 'miss' if html is None else 'hit').inc()
+        if html is None:
+            html = render()
+            self.backend.set(key, html)
+        return Markup(html)
+
+    def stats(self):
+        return self.backend.stats()
+
+fragment_cache = FragmentCache()
+
+#----------------------------------------------------------------------------#
+# Invalidation.
+#----------------------------------------------------------------------------#
+
+def touch_venues_of_artist(artist_id):
+    # an artist's name and image appear on the pages of venues it plays
+    table = Venue.__table__
+    db.session.execute(
+        table.update().
+          where(table.c.id.in_(db.session.query(Show.venue_id).filter(Show.artist_id == artist_id))).
+          values(version=table.c.version + 1)
+    )
+
+def touch_artists_of_venue(venue_id):
+    # a venue's name and image appear on the pages of artists playing there
+    table = Artist.__table__
+    db.session.execute(
+        table.update().
+          where(table.c.id.in_(db.session.query(Show.artist_id).filter(Show.venue_id == venue_id))).
+          values(version=table.c.version + 1)
+    )
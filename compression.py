@@ -0,0 +1,59 @@
+import gzip
+
+from flask import request
+
+#----------------------------------------------------------------------------#
+# Response compression.
+#----------------------------------------------------------------------------#
+
+# Gzips text responses (pages, JSON) of at least COMPRESS_MIN_SIZE bytes for
+# clients that accept it, at COMPRESS_LEVEL. Streamed responses (exports)
+# and files (static, asset bundles, which are pre-compressed) are left
+# alone. A strong ETag is weakened on compression, since it no longer names
+# the exact bytes sent; conditional requests compare ETags weakly.
+
+COMPRESSIBLE = frozenset([
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/csv',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'application/x-ndjson',
+    'image/svg+xml',
+])
+
+class Compressor(object):
+
+    def __init__(self, app=None):
+        self.min_size = 500
+        self.level = 6
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # register before other after_request hooks: Flask runs them in
+        # reverse, so compression sees the finished response
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', self.min_size)
+        self.level = app.config.get('COMPRESS_LEVEL', self.level)
+        app.after_request(self.compress)
+
+    def compress(self, response):
+        if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+                or response.mimetype not in COMPRESSIBLE or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        if not request.accept_encodings['gzip']:
+            return response
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        response.set_data(gzip.compress(data, compresslevel=self.level))
+        response.headers['Content-Encoding'] = 'gzip'
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+compressor = Compressor()
@@ -0,0 +1,151 @@
+from collections import Counter
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, text
+from models import db, Venue, Artist
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Venue and Artist carry upcoming_shows_count/past_shows_count so listings
+# can show them without touching Show. Show.counted_as_past records which
+# counter a show is currently in; `flask counters roll` (run from cron every
+# few minutes) moves shows that have started from upcoming to past. Every
+# counter change also bumps the row's version, which keys cached pages.
+
+ROLL_SQL = text('''
+    WITH rolled AS (
+        UPDATE "Show" SET counted_as_past = true
+        WHERE NOT counted_as_past AND start_time <= :now
+        RETURNING venue_id, artist_id
+    ), venues AS (
+        UPDATE "Venue" SET
+            upcoming_shows_count = upcoming_shows_count - rolled_venues.shows,
+            past_shows_count = past_shows_count + rolled_venues.shows,
+            version = version + 1
+        FROM (SELECT venue_id, count(*) AS shows FROM rolled GROUP BY venue_id) AS rolled_venues
+        WHERE "Venue".id = rolled_venues.venue_id
+    ), artists AS (
+        UPDATE "Artist" SET
+            upcoming_shows_count = upcoming_shows_count - rolled_artists.shows,
+            past_shows_count = past_shows_count + rolled_artists.shows,
+            version = version + 1
+        FROM (SELECT artist_id, count(*) AS shows FROM rolled GROUP BY artist_id) AS rolled_artists
+        WHERE "Artist".id = rolled_artists.artist_id
+    )
+    SELECT count(*) FROM rolled
+''')
+
+DELETE_VENUE_SHOWS_SQL = text('''
+    WITH deleted AS (
+        DELETE FROM "Show" WHERE venue_id = :venue_id
+        RETURNING artist_id, counted_as_past
+    )
+    UPDATE "Artist" SET
+        upcoming_shows_count = upcoming_shows_count - gone.upcoming,
+        past_shows_count = past_shows_count - gone.past,
+        version = version + 1
+    FROM (
+        SELECT artist_id,
+               count(*) FILTER (WHERE NOT counted_as_past) AS upcoming,
+               count(*) FILTER (WHERE counted_as_past) AS past
+        FROM deleted GROUP BY artist_id
+    ) AS gone
+    WHERE "Artist".id = gone.artist_id
+''')
+
+REBUILD_COUNTS_SQL = '''
+    UPDATE "%(table)s" SET
+        upcoming_shows_count = (SELECT count(*) FROM "Show"
+            WHERE "Show".%(key)s = "%(table)s".id AND NOT counted_as_past),
+        past_shows_count = (SELECT count(*) FROM "Show"
+            WHERE "Show".%(key)s = "%(table)s".id AND counted_as_past),
+        version = version + 1
+'''
+
+REBUILD_SQL = [
+    text('UPDATE "Show" SET counted_as_past = start_time <= :now'),
+    text(REBUILD_COUNTS_SQL % {'table': 'Venue', 'key': 'venue_id'}),
+    text(REBUILD_COUNTS_SQL % {'table': 'Artist', 'key': 'artist_id'}),
+]
+
+def _bump(entity, increments):
+    # increments maps (entity id, counter column) to the amount to add
+    by_column = {}
+    for (entity_id, column), amount in increments.items():
+        by_column.setdefault(column, []).append({'_id': entity_id, '_amount': amount})
+    table = entity.__table__
+    for column, params in by_column.items():
+        db.session.execute(
+            table.update().
+              where(table.c.id == bindparam('_id')).
+              values({
+                  column: table.c[column] + bindparam('_amount'),
+                  'version': table.c.version + 1
+              }),
+            params
+        )
+
+def _count(shows):
+    # shows: (venue id, artist id, counted as past) for each new show
+    venues = Counter()
+    artists = Counter()
+    for venue_id, artist_id, past in shows:
+        column = 'past_shows_count' if past else 'upcoming_shows_count'
+        venues[(int(venue_id), column)] += 1
+        artists[(int(artist_id), column)] += 1
+    _bump(Venue, venues)
+    _bump(Artist, artists)
+
+def count_new_shows(shows, now=None):
+    # Call with newly added Show objects before committing: marks each one
+    # as past or upcoming and bumps the matching venue and artist counters
+    # in the same transaction.
+    now = now or datetime.now()
+    for show in shows:
+        show.counted_as_past = show.start_time <= now
+    _count((show.venue_id, show.artist_id, show.counted_as_past) for show in shows)
+
+def count_new_show_rows(rows, now=None):
+    # the same for Show row dicts about to be inserted in bulk
+    now = now or datetime.now()
+    for row in rows:
+        row['counted_as_past'] = row['start_time'] <= now
+    _count((row['venue_id'], row['artist_id'], row['counted_as_past']) for row in rows)
+
+def delete_venue_shows(venue_id):
+    # deletes a venue's shows ahead of the venue itself, taking them off
+    # their artists' counters in the same statement
+    db.session.execute(DELETE_VENUE_SHOWS_SQL, {'venue_id': venue_id})
+
+def roll_counters(now=None):
+    # moves shows that have started since the last roll; returns how many
+    return db.session.execute(ROLL_SQL, {'now': now or datetime.now()}).scalar()
+
+def rebuild_counters(now=None):
+    now = now or datetime.now()
+    for statement in REBUILD_SQL:
+        db.session.execute(statement, {'now': now})
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+counters_cli = AppGroup('counters', help='Maintain the venue and artist show counters.')
+
+@counters_cli.command('roll')
+def roll_command():
+    """Move shows that have started from upcoming to past."""
+    rolled = roll_counters()
+    db.session.commit()
+    click.echo('%d shows moved to past' % rolled)
+
+@counters_cli.command('rebuild')
+def rebuild_command():
+    """Recompute every counter from the Show table."""
+    rebuild_counters()
+    db.session.commit()
+    click.echo('show counters rebuilt')
@@ -0,0 +1,168 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+import click
+import dateutil.parser
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select, func
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Bulk export.
+#----------------------------------------------------------------------------#
+
+# Streams whole tables out as CSV, NDJSON or columnar NDJSON (one object of
+# column arrays per batch, laid out like a Parquet row group). Rows come
+# through a server-side cursor a batch at a time, so memory stays flat
+# however large the table. With `since`, only rows whose updated_at is
+# newer are exported; every export reports a watermark to pass as `since`
+# next time. updated_at is its writer's transaction start, and a writer that
+# commits after the export's snapshot has stamps older than the export, so
+# the watermark is set EXPORT_OVERLAP seconds (the longest a write
+# transaction runs) before the snapshot: the next export re-reads that
+# window, and rows may arrive twice. Consumers upsert by id; within one
+# export an id appears once. Deleted rows are not reported.
+
+ENTITIES = {
+    'venues': Venue,
+    'artists': Artist,
+    'shows': Show,
+}
+
+FORMATS = ('csv', 'ndjson', 'columnar')
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'columnar': 'application/x-ndjson',
+}
+
+# bookkeeping columns derived from other rows, left out of exports
+INTERNAL_COLUMNS = ('version', 'upcoming_shows_count', 'past_shows_count', 'counted_as_past')
+
+def export_columns(entity):
+    return [column for column in entity.__table__.c if column.name not in INTERNAL_COLUMNS]
+
+def parse_since(value):
+    # raises ValueError on anything that is not a date/time
+    if value is None:
+        return None
+    try:
+        return dateutil.parser.parse(value)
+    except (TypeError, OverflowError):
+        raise ValueError('invalid since %r' % value)
+
+def watermark(overlap=0):
+    # the transaction's start time less overlap seconds, covering writers
+    # still in flight: rows changed after it show up next time
+    return db.session.execute(select([func.now() - timedelta(seconds=overlap)])).scalar()
+
+def stream_rows(entity, since=None, batch_size=1000):
+    # yields lists of up to batch_size row tuples, in id order
+    columns = export_columns(entity)
+    statement = select(columns).order_by(entity.__table__.c.id)
+    if since is not None:
+        statement = statement.where(entity.__table__.c.updated_at > since)
+    result = db.session.execute(statement.execution_options(stream_results=True))
+    try:
+        while True:
+            batch = result.fetchmany(batch_size)
+            if not batch:
+                break
+            yield batch
+    finally:
+        result.close()
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def _csv_value(value):
+    # genres are one cell separated by semicolons, as `flask import` reads them
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ';'.join(value)
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([_csv_value(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+def encode(batches, names, format):
+    # turns batches of row tuples into chunks of text in the given format
+    if format == 'csv':
+        yield _csv_lines([names])
+        for batch in batches:
+            yield _csv_lines(batch)
+    elif format == 'ndjson':
+        for batch in batches:
+            yield ''.join(
+                json.dumps(dict(zip(names, map(_json_value, row))), separators=(',', ':')) + '\n'
+                for row in batch
+            )
+    elif format == 'columnar':
+        for batch in batches:
+            columns = dict((name, [_json_value(value) for value in values])
+                           for name, values in zip(names, zip(*batch)))
+            yield json.dumps({'rows': len(batch), 'columns': columns}, separators=(',', ':')) + '\n'
+    else:
+        raise ValueError('unknown export format %r' % format)
+
+def export(entity, format, since=None, batch_size=1000):
+    names = [column.name for column in export_columns(entity)]
+    return encode(stream_rows(entity, since, batch_size), names, format)
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+export_cli = AppGroup('export', help='Stream venues, artists and shows out in bulk.')
+
+def export_options(command):
+    command = click.option('--format', 'format', type=click.Choice(FORMATS),
+                           default='ndjson', show_default=True)(command)
+    command = click.option('--since', help='Only rows changed after this ISO date/time.')(command)
+    command = click.option('--batch-size', default=1000, show_default=True)(command)
+    command = click.option('--output', type=click.File('w', encoding='utf-8'), default='-',
+                           help='Defaults to stdout.')(command)
+    return command
+
+def _run(entity, format, since, batch_size, output):
+    try:
+        since = parse_since(since)
+    except ValueError as err:
+        raise click.BadParameter(str(err), param_hint='--since')
+    mark = watermark(current_app.config['EXPORT_OVERLAP'])
+    for chunk in export(entity, format, since, batch_size):
+        output.write(chunk)
+    output.flush()
+    click.echo('watermark %s (pass as --since next time)' % mark.isoformat(), err=True)
+
+@export_cli.command('venues')
+@export_options
+def export_venues(format, since, batch_size, output):
+    """Export venues, or those changed since a time."""
+    _run(Venue, format, since, batch_size, output)
+
+@export_cli.command('artists')
+@export_options
+def export_artists(format, since, batch_size, output):
+    """Export artists, or those changed since a time."""
+    _run(Artist, format, since, batch_size, output)
+
+@export_cli.command('shows')
+@export_options
+def export_shows(format, since, batch_size, output):
+    """Export shows, or those changed since a time."""
+    _run(Show, format, since, batch_size, output)
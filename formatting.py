@@ -0,0 +1,62 @@
+from functools import lru_cache
+
+import dateutil.parser
+from babel import Locale
+from babel.dates import LC_TIME, UTC, format_datetime as babel_format_datetime, parse_pattern
+
+#----------------------------------------------------------------------------#
+# Date formatting.
+#----------------------------------------------------------------------------#
+
+PATTERNS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+class DateTimeFormatter(object):
+    # Formats datetimes like babel.dates.format_datetime, but resolves the
+    # locale once, compiles each pattern once and memoizes results, since
+    # the same start times come up again on every page that lists shows.
+
+    def __init__(self, locale=None, cache_size=16384):
+        self.locale = Locale.parse(locale or LC_TIME)
+        self._patterns = {}
+        self.format = lru_cache(maxsize=cache_size)(self._format)
+
+    def pattern(self, format):
+        compiled = self._patterns.get(format)
+        if compiled is None:
+            compiled = self._patterns[format] = parse_pattern(PATTERNS.get(format, format))
+        return compiled
+
+    def _format(self, value, format='medium'):
+        value = _as_datetime(value)
+        if format in ('long', 'short'):
+            # babel's other named formats combine separate date/time patterns
+            return babel_format_datetime(value, format, locale=self.locale)
+        return self.pattern(format).apply(value, self.locale)
+
+    def format_many(self, values, format='medium'):
+        # bulk path for a whole list: the pattern is compiled (or found) once
+        # up front and every value goes through format()'s cache, so start
+        # times seen on this or any earlier page are not formatted again
+        if format not in ('long', 'short'):
+            self.pattern(format)
+        format_one = self.format
+        return [format_one(value, format) for value in values]
+
+def _as_datetime(value):
+    # strings are parsed; naive datetimes get UTC as babel would give them
+    if isinstance(value, str):
+        value = dateutil.parser.parse(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return value
+
+formatter = DateTimeFormatter()
+
+def format_datetime(value, format='medium'):
+    return formatter.format(value, format)
+
+def format_datetimes(values, format='medium'):
+    return formatter.format_many(values, format)
@@ -0,0 +1,118 @@
+import csv
+import sys
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import text
+from models import db, Venue
+
+#----------------------------------------------------------------------------#
+# Offline geocoding.
+#----------------------------------------------------------------------------#
+
+# Venues are placed at the centre of their city, looked up by (city, state)
+# in a local gazetteer file; nothing goes over the network. The gazetteer
+# is a GeoNames cities dump (e.g. cities1000.txt from
+# download.geonames.org/export/dump/, tab separated, US states as admin1
+# codes); where a name is shared within a state the most populous place
+# wins. Street addresses are not resolved, so distances are to the city
+# centre. `flask geocode venues` fills venues without a location, every
+# city in one UPDATE; editing a venue's city or state clears its location
+# so the next run picks it up. A venue that moves gets a new version, so
+# its API ETag and cached page fragment change with it.
+
+# GeoNames columns
+NAME, ASCII_NAME, ALTERNATE_NAMES, LATITUDE, LONGITUDE = 1, 2, 3, 4, 5
+COUNTRY, ADMIN1, POPULATION = 8, 10, 14
+
+UPDATE_SQL = '''
+    UPDATE "Venue"
+    SET latitude = places.latitude, longitude = places.longitude,
+        version = "Venue".version + 1, updated_at = now()
+    FROM unnest(
+        CAST(:cities AS varchar[]),
+        CAST(:states AS varchar[]),
+        CAST(:latitudes AS double precision[]),
+        CAST(:longitudes AS double precision[])
+    ) AS places(city, state, latitude, longitude)
+    WHERE lower(trim("Venue".city)) = places.city
+      AND upper(trim("Venue".state)) = places.state
+      AND (%s)
+'''
+
+UPDATE_MISSING_SQL = text(UPDATE_SQL % '"Venue".latitude IS NULL')
+UPDATE_ALL_SQL = text(UPDATE_SQL % (
+    '("Venue".latitude, "Venue".longitude) IS DISTINCT FROM (places.latitude, places.longitude)'))
+
+def _key(city, state):
+    return (city or '').strip().lower(), (state or '').strip().upper()
+
+def load_gazetteer(source, country='US', alternate_names=False):
+    # {(city, state): (latitude, longitude)} from a GeoNames dump
+    places = {}
+    population = {}
+    csv.field_size_limit(sys.maxsize)
+    for row in csv.reader(source, delimiter='\t', quoting=csv.QUOTE_NONE):
+        if len(row) <= POPULATION or row[COUNTRY] != country:
+            continue
+        names = set([row[NAME], row[ASCII_NAME]])
+        if alternate_names and row[ALTERNATE_NAMES]:
+            names.update(row[ALTERNATE_NAMES].split(','))
+        size = int(row[POPULATION] or 0)
+        point = (float(row[LATITUDE]), float(row[LONGITUDE]))
+        for name in names:
+            key = _key(name, row[ADMIN1])
+            if population.get(key, -1) < size:
+                places[key] = point
+                population[key] = size
+    return places
+
+def geocode_venues(places, everything=False):
+    # locates venues from the gazetteer; returns (venues located, cities
+    # not in the gazetteer)
+    query = db.session.query(Venue.city, Venue.state).distinct()
+    if not everything:
+        query = query.filter(Venue.latitude.is_(None))
+    found = {}
+    missing = set()
+    for city, state in query:
+        key = _key(city, state)
+        if key in places:
+            found[key] = places[key]
+        else:
+            missing.add(key)
+    if not found:
+        return 0, missing
+    keys = sorted(found)
+    result = db.session.execute(UPDATE_ALL_SQL if everything else UPDATE_MISSING_SQL, {
+        'cities': [city for city, state in keys],
+        'states': [state for city, state in keys],
+        'latitudes': [found[key][0] for key in keys],
+        'longitudes': [found[key][1] for key in keys],
+    })
+    return result.rowcount, missing
+
+def forget_location(venue):
+    # call after a venue's city or state changed
+    venue.latitude = None
+    venue.longitude = None
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+geocode_cli = AppGroup('geocode', help='Locate venues from a local gazetteer.')
+
+@geocode_cli.command('venues')
+@click.argument('gazetteer', type=click.File('r', encoding='utf-8'))
+@click.option('--country', default='US', show_default=True, help='GeoNames country code to load.')
+@click.option('--alternate-names', is_flag=True, help='Also match GeoNames alternate names.')
+@click.option('--all', 'everything', is_flag=True, help='Relocate venues that already have a location.')
+def geocode_command(gazetteer, country, alternate_names, everything):
+    """Fill in venue locations from a GeoNames cities file."""
+    places = load_gazetteer(gazetteer, country, alternate_names)
+    located, missing = geocode_venues(places, everything)
+    db.session.commit()
+    click.echo('%d venues located from %d places' % (located, len(places)))
+    for city, state in sorted(missing):
+        click.echo('not in the gazetteer: %s, %s' % (city, state), err=True)
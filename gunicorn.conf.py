@@ -0,0 +1,15 @@
+# gunicorn settings (gunicorn -c gunicorn.conf.py wsgi:application)
+
+import os
+
+from prometheus_client import multiprocess
+
+# build and warm the app once in the master; workers fork from it
+# (GUNICORN_PRELOAD=0 builds it in every worker instead)
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+
+def child_exit(server, worker):
+    # drop a dead worker's live gauges (in-flight requests, pool) from the
+    # metrics shared through prometheus_multiproc_dir
+    multiprocess.mark_process_dead(worker.pid)
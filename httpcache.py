@@ -0,0 +1,156 @@
+import hashlib
+import json
+import time
+from collections import namedtuple
+
+from flask import Response, current_app, g, request, session
+from sqlalchemy import text
+from models import db, DATA_VERSION_TABLES
+
+#----------------------------------------------------------------------------#
+# HTTP caching.
+#----------------------------------------------------------------------------#
+
+# Views declare a cache policy. Public pages name the tables they read; their
+# weak ETag is derived from those tables' data version sequences (advanced
+# by triggers on every write), the URL and the build, so a conditional GET
+# is answered with a 304 after reading the sequences and before the view
+# runs any of its queries. They may be reused by browsers and shared caches
+# for HTTP_CACHE_MAX_AGE seconds. A sequence advances before its writer
+# commits, so while any of a page's tables has a write in progress (a
+# RowExclusiveLock, held until the commit is visible) the versions are not
+# trusted: the page is built fresh and sent without the public ETag, rather
+# than publishing old data under the new version. ETags also roll over
+# every HTTP_CACHE_ETAG_TTL seconds, since pages split shows into past and
+# upcoming by the clock. Private pages (forms) are never stored. Any other
+# GET response gets a weak ETag hashed from its body, which saves the
+# transfer but not the work. Pages showing flashed messages are personal
+# and are never stored or short-circuited.
+
+CachePolicy = namedtuple('CachePolicy', 'depends private')
+
+def cache_policy(depends=(), private=False):
+    # depends: the tables the page is built from
+    unknown = set(depends) - set(DATA_VERSION_TABLES)
+    if unknown:
+        raise ValueError('no data version for %s' % ', '.join(sorted(unknown)))
+    def decorate(view):
+        view.cache_policy = CachePolicy(tuple(sorted(depends)), private)
+        return view
+    return decorate
+
+# The sequences are read in a subquery the outer SELECT scans before it
+# checks pg_locks, so a writer that bumps a sequence after it was read still
+# holds its lock when the check runs.
+VERSIONS_SQL = '''
+    SELECT versions.*, NOT EXISTS (
+        SELECT 1 FROM pg_locks
+        WHERE locktype = 'relation'
+          AND database = (SELECT oid FROM pg_database WHERE datname = current_database())
+          AND relation IN (%(relations)s)
+          AND mode = 'RowExclusiveLock'
+          AND pid <> pg_backend_pid()
+    ) AS settled
+    FROM (SELECT %(versions)s OFFSET 0) AS versions
+'''
+
+def data_versions(tables):
+    # one round trip; the tables' versions, or None while any of them has a
+    # write in progress, whose data the versions may already count
+    row = db.session.execute(text(VERSIONS_SQL % {
+        'relations': ', '.join("'\"%s\"'::regclass" % table for table in tables),
+        'versions': ', '.join(
+            '(SELECT last_value FROM "%s_data_version") AS v%d' % (table, number)
+            for number, table in enumerate(tables)),
+    })).first()
+    return list(row)[:-1] if row.settled else None
+
+class HTTPCache(object):
+
+    def __init__(self, app=None):
+        self.max_age = 60
+        self.etag_ttl = 300
+        self.build = ''
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_age = app.config.get('HTTP_CACHE_MAX_AGE', self.max_age)
+        self.etag_ttl = app.config.get('HTTP_CACHE_ETAG_TTL', self.etag_ttl)
+        self.build = self.build_token(app)
+        app.before_request(self.revalidate)
+        app.after_request(self.finish)
+
+    def build_token(self, app):
+        # changes with any template, asset bundle or HTTP_CACHE_SALT, so a
+        # deploy does not answer 304 for pages it renders differently
+        digest = hashlib.sha1(str(app.config.get('HTTP_CACHE_SALT', '')).encode('utf-8'))
+        for name in sorted(app.jinja_env.list_templates()):
+            digest.update(app.jinja_loader.get_source(app.jinja_env, name)[0].encode('utf-8'))
+        assets = app.extensions.get('assets')
+        if assets is not None:
+            digest.update(json.dumps(assets.manifest, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()[:12]
+
+    def policy(self):
+        view = current_app.view_functions.get(request.endpoint)
+        return getattr(view, 'cache_policy', None)
+
+    def etag(self, policy):
+        # None while a write to the page's tables is in flight
+        parts = [self.build, request.full_path, str(int(time.time() // self.etag_ttl))]
+        if policy.depends:
+            versions = data_versions(policy.depends)
+            if versions is None:
+                return None
+            parts.extend(str(version) for version in versions)
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:20]
+
+    def revalidate(self):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        policy = self.policy()
+        if policy is None or policy.private:
+            return None
+        # only open the session when the client has one
+        if request.cookies.get(current_app.session_cookie_name) and session.get('_flashes'):
+            g.http_cache_personal = True
+            return None
+        etag = self.etag(policy)
+        if etag is None:
+            g.http_cache_unsettled = True
+            return None
+        g.page_etag = etag
+        if request.if_none_match.contains_weak(g.page_etag):
+            response = Response(status=304)
+            self.public(response)
+            return response
+        return None
+
+    def public(self, response):
+        response.set_etag(g.page_etag, weak=True)
+        response.cache_control.public = True
+        response.cache_control.max_age = self.max_age
+
+    def finish(self, response):
+        if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+            return response
+        policy = self.policy()
+        if policy is not None and policy.private:
+            response.cache_control.no_store = True
+            return response
+        if g.get('http_cache_personal'):
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        if g.get('http_cache_unsettled'):
+            # built during a write: only its own body may validate it
+            response.cache_control.no_cache = True
+        if 'page_etag' in g:
+            self.public(response)
+        elif response.get_etag() == (None, None) and not (response.is_streamed or response.direct_passthrough):
+            response.add_etag(weak=True)
+            response.make_conditional(request)
+        return response
+
+http_cache = HTTPCache()
@@ -0,0 +1,222 @@
+import csv
+import json
+import sys
+import time
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy.exc import DBAPIError
+from werkzeug.datastructures import MultiDict
+from forms import VenueForm, ArtistForm
+from models import db, Venue, Artist, Show
+from scheduling import schedule_shows
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+# Streams CSV or NDJSON listings into the database. Every row is checked
+# with the same form the create pages use, then valid rows are inserted a
+# batch at a time with one executemany per batch. A batch the database
+# refuses is retried row by row so one bad row never sinks its neighbours;
+# rejects are reported with their line number and reason. Shows are booked
+# through schedule_shows instead, so a show overlapping another at its
+# venue or by its artist is rejected as it would be by the scheduling API.
+
+def read_rows(stream, format):
+    # yields (line number, MultiDict) pairs without loading the whole file;
+    # lines that do not parse come through as None
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            data = MultiDict()
+            for key, value in row.items():
+                if key == 'genres':
+                    # genres are one cell, separated by semicolons
+                    for genre in (value or '').split(';'):
+                        if genre.strip():
+                            data.add(key, genre.strip())
+                elif value is not None:
+                    data.add(key, value)
+            yield reader.line_num, data
+    else:
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if not isinstance(record, dict):
+                yield number, None
+                continue
+            yield number, record_data(record)
+
+def record_data(record):
+    # a decoded JSON object as the MultiDict a form would have posted
+    data = MultiDict()
+    for key, value in record.items():
+        for item in (value if isinstance(value, list) else [value]):
+            if isinstance(item, bool):
+                # a BooleanField is true for any non-empty value
+                if item:
+                    data.add(key, 'y')
+            elif item is not None:
+                data.add(key, str(item))
+    return data
+
+class Importer(object):
+
+    def __init__(self, form_class, entity, batch_size=1000, rejects=None):
+        self.form_class = form_class
+        self.table = entity.__table__
+        self.batch_size = batch_size
+        self.rejects = rejects or sys.stderr
+        self.loaded = 0
+        self.rejected = 0
+        self.started = time.time()
+
+    def validate(self, data):
+        form = self.form_class(data, meta={'csrf': False})
+        if not form.validate():
+            return None, form.errors
+        return dict((key, value) for key, value in form.data.items() if key in self.table.c), None
+
+    def reject(self, number, errors):
+        self.rejected += 1
+        self.rejects.write(json.dumps({'line': number, 'errors': errors}) + '\n')
+
+    def insert(self, rows):
+        db.session.execute(self.table.insert(), rows)
+
+    def load(self, batch):
+        if not batch:
+            return
+        savepoint = db.session.begin_nested()
+        try:
+            self.insert([row for number, row in batch])
+            savepoint.commit()
+            self.loaded += len(batch)
+        except DBAPIError:
+            savepoint.rollback()
+            for number, row in batch:
+                savepoint = db.session.begin_nested()
+                try:
+                    self.insert([row])
+                    savepoint.commit()
+                    self.loaded += 1
+                except DBAPIError as err:
+                    savepoint.rollback()
+                    self.reject(number, {'database': [str(err.orig).strip()]})
+        db.session.commit()
+
+    def progress(self):
+        elapsed = max(time.time() - self.started, 0.001)
+        click.echo('%d loaded, %d rejected, %.0f rows/s' % (
+            self.loaded, self.rejected, (self.loaded + self.rejected) / elapsed
+        ), err=True)
+
+    def run(self, rows):
+        batch = []
+        for number, data in rows:
+            if data is None:
+                self.reject(number, {'line': ['not a JSON object']})
+                continue
+            row, errors = self.validate(data)
+            if errors:
+                self.reject(number, errors)
+                continue
+            batch.append((number, row))
+            if len(batch) >= self.batch_size:
+                self.load(batch)
+                self.progress()
+                batch = []
+        if batch:
+            self.load(batch)
+        self.progress()
+
+class ShowImporter(Importer):
+    # shows are booked a batch at a time through schedule_shows, like the
+    # scheduling API: it validates them, locks their venues and artists,
+    # checks them for overlaps and keeps the counters and calendar current
+
+    def __init__(self, *args, **kwargs):
+        super(ShowImporter, self).__init__(None, Show, *args, **kwargs)
+
+    def validate(self, data):
+        # left to schedule_shows, which validates the whole batch
+        return data, None
+
+    def schedule(self, batch):
+        result = schedule_shows([data for number, data in batch])
+        for error in result['errors']:
+            self.reject(batch[error['index']][0], error['errors'])
+        clashes = {}
+        for conflict in result['conflicts']:
+            if 'show_id' in conflict:
+                message = 'overlaps show %d' % conflict['show_id']
+            else:
+                message = 'overlaps line %d' % batch[conflict['batch_index']][0]
+            clashes.setdefault(conflict['index'], {}).setdefault(
+                conflict['conflict'] + '_id', []).append(message)
+        for index, errors in sorted(clashes.items()):
+            self.reject(batch[index][0], errors)
+        self.loaded += len(result['scheduled'])
+
+    def load(self, batch):
+        if not batch:
+            return
+        savepoint = db.session.begin_nested()
+        try:
+            self.schedule(batch)
+            savepoint.commit()
+        except DBAPIError:
+            savepoint.rollback()
+            for number, data in batch:
+                savepoint = db.session.begin_nested()
+                try:
+                    self.schedule([(number, data)])
+                    savepoint.commit()
+                except DBAPIError as err:
+                    savepoint.rollback()
+                    self.reject(number, {'database': [str(err.orig).strip()]})
+        # releases the batch's advisory locks
+        db.session.commit()
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+import_cli = AppGroup('import', help='Bulk import venues, artists and shows.')
+
+def import_options(command):
+    command = click.argument('source', type=click.File('r', encoding='utf-8'))(command)
+    command = click.option('--format', 'format', type=click.Choice(['csv', 'ndjson']),
+                           help='Defaults to the file extension.')(command)
+    command = click.option('--batch-size', default=1000, show_default=True)(command)
+    command = click.option('--rejects', type=click.File('w', encoding='utf-8'),
+                           help='Write rejected rows as NDJSON here instead of stderr.')(command)
+    return command
+
+def _run(importer, source, format):
+    if format is None:
+        format = 'csv' if source.name.endswith('.csv') else 'ndjson'
+    importer.run(read_rows(source, format))
+
+@import_cli.command('venues')
+@import_options
+def import_venues(source, format, batch_size, rejects):
+    """Import venues from a CSV or NDJSON file."""
+    _run(Importer(VenueForm, Venue, batch_size, rejects), source, format)
+
+@import_cli.command('artists')
+@import_options
+def import_artists(source, format, batch_size, rejects):
+    """Import artists from a CSV or NDJSON file."""
+    _run(Importer(ArtistForm, Artist, batch_size, rejects), source, format)
+
+@import_cli.command('shows')
+@import_options
+def import_shows(source, format, batch_size, rejects):
+    """Import shows from a CSV or NDJSON file."""
+    _run(ShowImporter(batch_size, rejects), source, format)
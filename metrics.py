@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+
+from flask import Blueprint, Response, g, has_request_context, jsonify, request
+from flask import before_render_template, template_rendered
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess
+)
+from pool import pool_stats
+
+#----------------------------------------------------------------------------#
+# Metrics.
+#----------------------------------------------------------------------------#
+
+# Prometheus metrics for requests, template rendering, SQL and the fragment
+# cache, served on /metrics. Under gunicorn, point the
+# prometheus_multiproc_dir environment variable at an empty directory
+# before the workers start: every worker then writes its samples there and
+# /metrics reports the sum over all of them, whichever worker answers.
+# gunicorn.conf.py cleans up after workers that exit.
+
+REQUEST_SECONDS = Histogram(
+    'fyyur_request_seconds', 'Request latency by endpoint.', ['method', 'endpoint'])
+REQUESTS = Counter(
+    'fyyur_requests_total', 'Requests served by endpoint and status.', ['method', 'endpoint', 'status'])
+IN_FLIGHT = Gauge(
+    'fyyur_requests_in_flight', 'Requests being served.', multiprocess_mode='livesum')
+TEMPLATE_SECONDS = Histogram(
+    'fyyur_template_render_seconds', 'Template render time.', ['template'])
+DB_SECONDS = Histogram(
+    'fyyur_db_statement_seconds', 'SQL statement time by endpoint.', ['endpoint'],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, float('inf')))
+CACHE_LOOKUPS = Counter(
+    'fyyur_cache_lookups_total', 'Cache lookups by cache and result (hit/miss).', ['cache', 'result'])
+POOL_CHECKED_OUT = Gauge(
+    'fyyur_db_pool_checked_out', 'Connections checked out of the pool.', multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge(
+    'fyyur_db_pool_overflow', 'Connections open past the pool size.', multiprocess_mode='livesum')
+POOL_WAIT_SECONDS = Counter(
+    'fyyur_db_pool_wait_seconds_total', 'Time spent waiting for pool checkouts.')
+POOL_TIMEOUTS = Counter(
+    'fyyur_db_pool_timeouts_total', 'Pool checkouts that timed out.')
+
+# the pool's running totals as last added to the counters, per process
+_pool_reported = {'wait_seconds_total': 0.0, 'timeouts': 0}
+_pool_reported_lock = threading.Lock()
+
+def endpoint_label():
+    return (request.endpoint or 'unmatched') if has_request_context() else 'none'
+
+def _before_render(sender, template, context, **extra):
+    g.setdefault('render_started', []).append(time.time())
+
+def _rendered(sender, template, context, **extra):
+    started = g.get('render_started')
+    if started:
+        TEMPLATE_SECONDS.labels(template.name or 'string').observe(time.time() - started.pop())
+
+class RequestMetrics(object):
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # DB_SECONDS is observed by the query profiler's cursor events
+        before_render_template.connect(_before_render, app)
+        template_rendered.connect(_rendered, app)
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.teardown_request(self.teardown)
+
+    def start(self):
+        g.request_started = time.time()
+        IN_FLIGHT.inc()
+
+    def finish(self, response):
+        started = g.get('request_started')
+        if started is not None:
+            endpoint = endpoint_label()
+            REQUEST_SECONDS.labels(request.method, endpoint).observe(time.time() - started)
+            REQUESTS.labels(request.method, endpoint, response.status_code).inc()
+        return response
+
+    def teardown(self, exc):
+        if g.pop('request_started', None) is not None:
+            IN_FLIGHT.dec()
+        # pool figures are per process; the gauges sum them over live
+        # workers, and the counters take each worker's growth since it last
+        # reported, so they keep what exited workers added
+        stats = pool_stats()
+        if 'checked_out' in stats:
+            POOL_CHECKED_OUT.set(stats['checked_out'])
+            POOL_OVERFLOW.set(stats['overflow'])
+            with _pool_reported_lock:
+                waited = stats['wait_seconds_total'] - _pool_reported['wait_seconds_total']
+                timeouts = stats['timeouts'] - _pool_reported['timeouts']
+                _pool_reported['wait_seconds_total'] = stats['wait_seconds_total']
+                _pool_reported['timeouts'] = stats['timeouts']
+            if waited > 0:
+                POOL_WAIT_SECONDS.inc(waited)
+            if timeouts > 0:
+                POOL_TIMEOUTS.inc(timeouts)
+
+request_metrics = RequestMetrics()
+
+#----------------------------------------------------------------------------#
+# Endpoints.
+#----------------------------------------------------------------------------#
+
+metrics = Blueprint('metrics', __name__, url_prefix='/metrics')
+
+@metrics.route('')
+def prometheus():
+    if 'prometheus_multiproc_dir' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+# Figures are per worker process: each gunicorn worker has its own pool.
+
+@metrics.route('/pool')
+def pool_metrics():
+    return jsonify(dict(pool_stats(), pid=os.getpid()))
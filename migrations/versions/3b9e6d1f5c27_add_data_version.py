@@ -0,0 +1,54 @@
+"""add data version
+
+Revision ID: 3b9e6d1f5c27
+Revises: 71e0a5c3b8d2
+Create Date: 2026-10-18 18:40:51.208314
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9e6d1f5c27'
+down_revision = '71e0a5c3b8d2'
+branch_labels = None
+depends_on = None
+
+TABLES = ['Venue', 'Artist', 'Show', 'UpcomingShow']
+
+
+def upgrade():
+    op.create_table('DataVersion',
+    sa.Column('table_name', sa.String(length=63), nullable=False),
+    sa.Column('version', sa.BigInteger(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    op.execute('''
+        INSERT INTO "DataVersion" (table_name)
+        VALUES %s
+    ''' % ', '.join("('%s')" % table for table in TABLES))
+    # once per statement, not per row, so bulk writes pay for one update;
+    # the row lock it takes is held to commit, so versions only ever grow
+    # in commit order
+    op.execute('''
+        CREATE FUNCTION bump_data_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE "DataVersion" SET version = version + 1 WHERE table_name = TG_TABLE_NAME;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    for table in TABLES:
+        op.execute('''
+            CREATE TRIGGER "%(table)s_data_version"
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "%(table)s"
+            FOR EACH STATEMENT EXECUTE PROCEDURE bump_data_version()
+        ''' % {'table': table})
+
+
+def downgrade():
+    for table in TABLES:
+        op.execute('DROP TRIGGER "%(table)s_data_version" ON "%(table)s"' % {'table': table})
+    op.execute('DROP FUNCTION bump_data_version()')
+    op.drop_table('DataVersion')
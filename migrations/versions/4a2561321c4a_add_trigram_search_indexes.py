@@ -0,0 +1,40 @@
+"""add trigram search indexes
+
+Revision ID: 4a2561321c4a
+Revises: 041ee8ff31ef
+Create Date: 2026-10-18 09:12:41.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a2561321c4a'
+down_revision = '041ee8ff31ef'
+branch_labels = None
+depends_on = None
+
+TRIGRAM_INDEXES = [
+    ('ix_Venue_name_trgm', 'Venue', 'name'),
+    ('ix_Venue_city_trgm', 'Venue', 'city'),
+    ('ix_Venue_state_trgm', 'Venue', 'state'),
+    ('ix_Artist_name_trgm', 'Artist', 'name'),
+    ('ix_Artist_city_trgm', 'Artist', 'city'),
+    ('ix_Artist_state_trgm', 'Artist', 'state'),
+]
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRIGRAM_INDEXES:
+        op.create_index(
+            name, table, [column],
+            postgresql_using='gin',
+            postgresql_ops={column: 'gin_trgm_ops'}
+        )
+
+
+def downgrade():
+    for name, table, column in TRIGRAM_INDEXES:
+        op.drop_index(name, table_name=table)
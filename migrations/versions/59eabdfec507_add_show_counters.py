@@ -0,0 +1,47 @@
+"""add show counters
+
+Revision ID: 59eabdfec507
+Revises: b3e6449d1381
+Create Date: 2026-10-18 10:41:09.330147
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '59eabdfec507'
+down_revision = 'b3e6449d1381'
+branch_labels = None
+depends_on = None
+
+BACKFILL_COUNTS_SQL = '''
+    UPDATE "%(table)s" SET
+        upcoming_shows_count = (SELECT count(*) FROM "Show"
+            WHERE "Show".%(key)s = "%(table)s".id AND NOT counted_as_past),
+        past_shows_count = (SELECT count(*) FROM "Show"
+            WHERE "Show".%(key)s = "%(table)s".id AND counted_as_past)
+'''
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Show', sa.Column('counted_as_past', sa.Boolean(), server_default='false', nullable=False))
+    op.create_index(
+        'ix_Show_start_time_not_counted_as_past', 'Show', ['start_time'],
+        unique=False, postgresql_where=sa.text('NOT counted_as_past')
+    )
+
+    op.execute('UPDATE "Show" SET counted_as_past = start_time <= now()')
+    op.execute(BACKFILL_COUNTS_SQL % {'table': 'Venue', 'key': 'venue_id'})
+    op.execute(BACKFILL_COUNTS_SQL % {'table': 'Artist', 'key': 'artist_id'})
+
+
+def downgrade():
+    op.drop_index('ix_Show_start_time_not_counted_as_past', table_name='Show')
+    op.drop_column('Show', 'counted_as_past')
+    for table in ('Artist', 'Venue'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,26 @@
+"""add genre indexes
+
+Revision ID: 5f2c8a4d9e13
+Revises: 3b9e6d1f5c27
+Create Date: 2026-10-18 19:12:37.604118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f2c8a4d9e13'
+down_revision = '3b9e6d1f5c27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Venue_genres', 'Venue', ['genres'], unique=False, postgresql_using='gin')
+    op.create_index('ix_Artist_genres', 'Artist', ['genres'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_Artist_genres', table_name='Artist')
+    op.drop_index('ix_Venue_genres', table_name='Venue')
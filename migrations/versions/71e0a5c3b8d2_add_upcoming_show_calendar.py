@@ -0,0 +1,57 @@
+"""add upcoming show calendar
+
+Revision ID: 71e0a5c3b8d2
+Revises: d2b7c91e4f06
+Create Date: 2026-10-18 15:03:12.540917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '71e0a5c3b8d2'
+down_revision = 'd2b7c91e4f06'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('UpcomingShow',
+    sa.Column('show_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('duration', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('venue_name', sa.String(), nullable=True),
+    sa.Column('venue_city', sa.String(length=120), nullable=True),
+    sa.Column('venue_state', sa.String(length=120), nullable=True),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('artist_name', sa.String(), nullable=True),
+    sa.Column('artist_image_link', sa.String(length=500), nullable=True),
+    sa.ForeignKeyConstraint(['show_id'], ['Show.id'], ondelete='cascade'),
+    sa.PrimaryKeyConstraint('show_id')
+    )
+    op.create_index('ix_UpcomingShow_day_start_time', 'UpcomingShow', ['day', 'start_time', 'show_id'], unique=False)
+    op.create_index(op.f('ix_UpcomingShow_venue_id'), 'UpcomingShow', ['venue_id'], unique=False)
+    op.create_index(op.f('ix_UpcomingShow_artist_id'), 'UpcomingShow', ['artist_id'], unique=False)
+    # fill it from the shows already booked
+    op.execute('''
+        INSERT INTO "UpcomingShow" (show_id, day, start_time, duration,
+                                    venue_id, venue_name, venue_city, venue_state,
+                                    artist_id, artist_name, artist_image_link)
+        SELECT "Show".id, "Show".start_time::date, "Show".start_time, "Show".duration,
+               "Venue".id, "Venue".name, "Venue".city, "Venue".state,
+               "Artist".id, "Artist".name, "Artist".image_link
+        FROM "Show"
+        JOIN "Venue" ON "Venue".id = "Show".venue_id
+        JOIN "Artist" ON "Artist".id = "Show".artist_id
+        WHERE "Show".start_time > now()
+    ''')
+
+
+def downgrade():
+    op.drop_index(op.f('ix_UpcomingShow_artist_id'), table_name='UpcomingShow')
+    op.drop_index(op.f('ix_UpcomingShow_venue_id'), table_name='UpcomingShow')
+    op.drop_index('ix_UpcomingShow_day_start_time', table_name='UpcomingShow')
+    op.drop_table('UpcomingShow')
@@ -0,0 +1,28 @@
+"""add updated_at
+
+Revision ID: 8c1f4b2e7a90
+Revises: f665e78ded55
+Create Date: 2026-10-18 13:02:17.412905
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1f4b2e7a90'
+down_revision = 'f665e78ded55'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist', 'Show'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+        op.create_index(op.f('ix_%s_updated_at' % table), table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('Show', 'Artist', 'Venue'):
+        op.drop_index(op.f('ix_%s_updated_at' % table), table_name=table)
+        op.drop_column(table, 'updated_at')
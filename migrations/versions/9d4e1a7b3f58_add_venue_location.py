@@ -0,0 +1,34 @@
+"""add venue location
+
+Revision ID: 9d4e1a7b3f58
+Revises: 5f2c8a4d9e13
+Create Date: 2026-10-18 19:48:05.913327
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4e1a7b3f58'
+down_revision = '5f2c8a4d9e13'
+branch_labels = None
+depends_on = None
+
+LOCATION = 'll_to_earth(latitude, longitude)'
+
+
+def upgrade():
+    # earthdistance (ll_to_earth, earth_box) is built on cube, whose GiST
+    # opclass also orders by <-> for nearest-first scans
+    op.execute('CREATE EXTENSION IF NOT EXISTS cube')
+    op.execute('CREATE EXTENSION IF NOT EXISTS earthdistance')
+    op.add_column('Venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('longitude', sa.Float(), nullable=True))
+    op.create_index('ix_Venue_location', 'Venue', [sa.text(LOCATION)], postgresql_using='gist')
+
+
+def downgrade():
+    op.drop_index('ix_Venue_location', table_name='Venue')
+    op.drop_column('Venue', 'longitude')
+    op.drop_column('Venue', 'latitude')
@@ -0,0 +1,27 @@
+"""add artist directory indexes
+
+Revision ID: a6f3c9e2b8d4
+Revises: e4b7d2a9c1f3
+Create Date: 2026-10-19 11:24:53.207718
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6f3c9e2b8d4'
+down_revision = 'e4b7d2a9c1f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Artist_name_id', 'Artist', ['name', 'id'], unique=False)
+    op.create_index('ix_Artist_initial_name_id', 'Artist',
+                    [sa.text('upper(substr(name, 1, 1))'), 'name', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Artist_initial_name_id', table_name='Artist')
+    op.drop_index('ix_Artist_name_id', table_name='Artist')
@@ -0,0 +1,28 @@
+"""add show composite indexes
+
+Revision ID: b3e6449d1381
+Revises: 4a2561321c4a
+Create Date: 2026-10-18 10:03:27.518836
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e6449d1381'
+down_revision = '4a2561321c4a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
@@ -0,0 +1,58 @@
+"""data version sequences
+
+Revision ID: c8a1f4e6d2b9
+Revises: 9d4e1a7b3f58
+Create Date: 2026-10-19 10:21:44.318502
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8a1f4e6d2b9'
+down_revision = '9d4e1a7b3f58'
+branch_labels = None
+depends_on = None
+
+TABLES = ['Venue', 'Artist', 'Show', 'UpcomingShow']
+
+
+def upgrade():
+    # The DataVersion rows were updated by every write statement and their
+    # locks held to commit, so writers to a table queued behind each other
+    # and transactions touching the tables in different orders deadlocked.
+    # nextval() takes no lock and is not rolled back; the triggers stay.
+    for table in TABLES:
+        op.execute('CREATE SEQUENCE "%s_data_version"' % table)
+    op.execute('''
+        CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+        BEGIN
+            PERFORM nextval(format('%I', TG_TABLE_NAME || '_data_version'));
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    op.drop_table('DataVersion')
+
+
+def downgrade():
+    op.create_table('DataVersion',
+    sa.Column('table_name', sa.String(length=63), nullable=False),
+    sa.Column('version', sa.BigInteger(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    op.execute('''
+        INSERT INTO "DataVersion" (table_name)
+        VALUES %s
+    ''' % ', '.join("('%s')" % table for table in TABLES))
+    op.execute('''
+        CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE "DataVersion" SET version = version + 1 WHERE table_name = TG_TABLE_NAME;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    for table in TABLES:
+        op.execute('DROP SEQUENCE "%s_data_version"' % table)
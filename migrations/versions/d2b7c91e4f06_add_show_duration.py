@@ -0,0 +1,32 @@
+"""add show duration and booking period indexes
+
+Revision ID: d2b7c91e4f06
+Revises: 8c1f4b2e7a90
+Create Date: 2026-10-18 14:21:40.118276
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2b7c91e4f06'
+down_revision = '8c1f4b2e7a90'
+branch_labels = None
+depends_on = None
+
+PERIOD = "tsrange(start_time, start_time + duration * interval '1 minute')"
+
+
+def upgrade():
+    # btree_gist lets a GiST index pair an integer id with a range
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.add_column('Show', sa.Column('duration', sa.Integer(), server_default='120', nullable=False))
+    op.create_index('ix_Show_venue_id_period', 'Show', ['venue_id', sa.text(PERIOD)], postgresql_using='gist')
+    op.create_index('ix_Show_artist_id_period', 'Show', ['artist_id', sa.text(PERIOD)], postgresql_using='gist')
+
+
+def downgrade():
+    op.drop_index('ix_Show_artist_id_period', table_name='Show')
+    op.drop_index('ix_Show_venue_id_period', table_name='Show')
+    op.drop_column('Show', 'duration')
@@ -0,0 +1,24 @@
+"""add venue area index
+
+Revision ID: e4b7d2a9c1f3
+Revises: c8a1f4e6d2b9
+Create Date: 2026-10-19 11:02:17.540913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b7d2a9c1f3'
+down_revision = 'c8a1f4e6d2b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Venue_state_city_name', 'Venue', ['state', 'city', 'name'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_state_city_name', table_name='Venue')
@@ -0,0 +1,26 @@
+"""add row versions
+
+Revision ID: f665e78ded55
+Revises: 59eabdfec507
+Create Date: 2026-10-18 11:26:52.870413
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f665e78ded55'
+down_revision = '59eabdfec507'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('Artist', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('Artist', 'version')
+    op.drop_column('Venue', 'version')
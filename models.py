@@ -5,14 +5,41 @@ from flask_sqlalchemy import SQLAlchemy
 #----------------------------------------------------------------------------#
 db = SQLAlchemy()
 
+def trigram_index(table, column):
+    # GIN pg_trgm index backing case-insensitive partial (ILIKE) search
+    return db.Index(
+        'ix_%s_%s_trgm' % (table, column), column,
+        postgresql_using='gin',
+        postgresql_ops={column: 'gin_trgm_ops'}
+    )
+
+# a venue's point on the earth's surface (cube/earthdistance)
+VENUE_LOCATION = 'll_to_earth(latitude, longitude)'
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        trigram_index('Venue', 'name'),
+        trigram_index('Venue', 'city'),
+        trigram_index('Venue', 'state'),
+        # the venue directory: areas walked in (state, city) order, each
+        # area's venues by name
+        db.Index('ix_Venue_state_city_name', 'state', 'city', 'name'),
+        # genre browse and search: genres @> / && ARRAY[...]
+        db.Index('ix_Venue_genres', 'genres', postgresql_using='gin'),
+        # nearby venues: earth_box() radius and <-> nearest-first on the
+        # location, with the cube and earthdistance extensions
+        db.Index('ix_Venue_location', db.text(VENUE_LOCATION), postgresql_using='gist'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     address = db.Column(db.String(120))
+    # degrees, from the city gazetteer (`flask geocode venues`)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
     genres = db.Column(db.ARRAY(db.String))
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
@@ -20,9 +47,27 @@ class Venue(db.Model):
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, default=True)
     seeking_description = db.Column(db.String(120))
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now(), onupdate=db.func.now(), index=True)
     shows=db.relationship('Show', backref='venue', passive_deletes=True)
+
+    # bumped on every change that alters the venue page (cache key/ETag)
+    __mapper_args__ = {'version_id_col': version}
+
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        trigram_index('Artist', 'name'),
+        trigram_index('Artist', 'city'),
+        trigram_index('Artist', 'state'),
+        # the artist directory, all of it or by initial, in name order
+        db.Index('ix_Artist_name_id', 'name', 'id'),
+        db.Index('ix_Artist_initial_name_id', db.text('upper(substr(name, 1, 1))'), 'name', 'id'),
+        # genre browse and search: genres @> / && ARRAY[...]
+        db.Index('ix_Artist_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -35,13 +80,73 @@ class Artist(db.Model):
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(120), nullable=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now(), onupdate=db.func.now(), index=True)
+
+    # bumped on every change that alters the artist page (cache key/ETag)
+    __mapper_args__ = {'version_id_col': version}
+
+# the time a show holds its venue and artist, as a Postgres range; GiST
+# indexes on (venue_id|artist_id, period) need the btree_gist extension
+SHOW_PERIOD = "tsrange(start_time, start_time + duration * interval '1 minute')"
+
+# minutes a show is booked for when no duration is given
+DEFAULT_SHOW_DURATION = 120
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        # detail pages and the venue delete cascade filter by entity and
+        # start_time; the shows feed seeks on (start_time, id)
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+        # shows still waiting to be rolled from upcoming to past
+        db.Index(
+            'ix_Show_start_time_not_counted_as_past', 'start_time',
+            postgresql_where=db.text('NOT counted_as_past')
+        ),
+        # booking conflicts: overlapping periods at one venue or for one artist
+        db.Index('ix_Show_venue_id_period', 'venue_id', db.text(SHOW_PERIOD), postgresql_using='gist'),
+        db.Index('ix_Show_artist_id_period', 'artist_id', db.text(SHOW_PERIOD), postgresql_using='gist'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     start_time = db.Column(db.DateTime, nullable=False)
+    # minutes
+    duration = db.Column(db.Integer, nullable=False, default=DEFAULT_SHOW_DURATION,
+                         server_default=str(DEFAULT_SHOW_DURATION))
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete="cascade"), nullable=False)
+    counted_as_past = db.Column(db.Boolean, nullable=False, default=False, server_default='false')
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now(), onupdate=db.func.now(), index=True)
+
+    artist = db.relationship('Artist', backref='shows', lazy=False)
+
+class UpcomingShow(db.Model):
+    # calendar of upcoming shows, one row per show with the venue and artist
+    # fields the calendar displays; maintained by upcoming.py
+    __tablename__ = 'UpcomingShow'
+    __table_args__ = (
+        db.Index('ix_UpcomingShow_day_start_time', 'day', 'start_time', 'show_id'),
+    )
+
+    show_id = db.Column(db.Integer, db.ForeignKey('Show.id', ondelete="cascade"), primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    duration = db.Column(db.Integer, nullable=False)
+    venue_id = db.Column(db.Integer, nullable=False, index=True)
+    venue_name = db.Column(db.String)
+    venue_city = db.Column(db.String(120))
+    venue_state = db.Column(db.String(120))
+    artist_id = db.Column(db.Integer, nullable=False, index=True)
+    artist_name = db.Column(db.String)
+    artist_image_link = db.Column(db.String(500))
 
-    artist = db.relationship('Artist', backref='shows', lazy=False)
\ No newline at end of file
+# Every insert, update, delete or truncate of these tables advances the
+# sequence "<table>_data_version" from a statement trigger (see the
+# data_version_sequences migration); pages fold the sequences' values into
+# their ETags. nextval() takes no lock, so writers never wait on it.
+DATA_VERSION_TABLES = ('Venue', 'Artist', 'Show', 'UpcomingShow')
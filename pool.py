@@ -0,0 +1,84 @@
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+from models import db
+
+#----------------------------------------------------------------------------#
+# Connection pool.
+#----------------------------------------------------------------------------#
+
+# The engine's QueuePool is sized from the environment in config.py; this
+# subclass counts what happens to it so the pool can be sized per worker:
+# how long checkouts wait, how often the pool overflows past pool_size and
+# how often a checkout gives up after pool_timeout.
+
+class InstrumentedQueuePool(QueuePool):
+
+    def __init__(self, *args, **kwargs):
+        super(InstrumentedQueuePool, self).__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.overflows = 0
+        self.timeouts = 0
+        self._stats_lock = threading.Lock()
+
+    def recreate(self):
+        # invalidation swaps in a fresh pool; keep counting on it
+        pool = super(InstrumentedQueuePool, self).recreate()
+        pool.checkouts, pool.wait_total, pool.wait_max = self.checkouts, self.wait_total, self.wait_max
+        pool.overflows, pool.timeouts = self.overflows, self.timeouts
+        return pool
+
+    def _do_get(self):
+        started = time.time()
+        try:
+            conn = super(InstrumentedQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        waited = time.time() - started
+        with self._stats_lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        return conn
+
+    def _inc_overflow(self):
+        # _overflow starts at -pool_size; above zero is past the pool size
+        opened = super(InstrumentedQueuePool, self)._inc_overflow()
+        if opened and self._overflow > 0:
+            with self._stats_lock:
+                self.overflows += 1
+        return opened
+
+    def stats(self):
+        return {
+            'size': self.size(),
+            'max_overflow': self._max_overflow,
+            'checked_out': self.checkedout(),
+            'checked_in': self.checkedin(),
+            'overflow': max(self.overflow(), 0),
+            'checkouts': self.checkouts,
+            'wait_seconds_total': round(self.wait_total, 6),
+            'wait_seconds_max': round(self.wait_max, 6),
+            'overflow_events': self.overflows,
+            'timeouts': self.timeouts,
+        }
+
+def init_pool(app):
+    # must run before the engine is first used; config.py's options dict is
+    # shared by every app built from it, so this app gets its own copy
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    options.setdefault('poolclass', InstrumentedQueuePool)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+def pool_stats(app=None):
+    pool = db.get_engine(app or current_app).pool
+    if not isinstance(pool, InstrumentedQueuePool):
+        return {'status': pool.status()}
+    return pool.stats()
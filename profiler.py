@@ -0,0 +1,122 @@
+import heapq
+import json
+import logging
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from metrics import DB_SECONDS, endpoint_label
+
+#----------------------------------------------------------------------------#
+# Query profiler.
+#----------------------------------------------------------------------------#
+
+# Counts the SQL statements each request runs, their total time and the
+# slowest few, from engine cursor events. With QUERY_PROFILER = 'headers'
+# (development) the figures go out as X-Query-* and Server-Timing response
+# headers; with 'log' (production) every request writes one JSON line to the
+# fyyur.queries logger. Requests running more than QUERY_COUNT_THRESHOLD
+# statements are flagged either way, which is how N+1 loops show up. The
+# same timings feed the fyyur_db_statement_seconds histogram, so the cursor
+# events are listened to even with QUERY_PROFILER = 'off'.
+
+logger = logging.getLogger('fyyur.queries')
+
+class RequestQueries(object):
+
+    def __init__(self, keep=3):
+        self.keep = keep
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest = []
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        entry = (seconds, self.count, statement)
+        if len(self.slowest) < self.keep:
+            heapq.heappush(self.slowest, entry)
+        elif entry > self.slowest[0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def slowest_statements(self):
+        return [
+            {'ms': round(seconds * 1000, 2), 'statement': ' '.join(statement.split())[:300]}
+            for seconds, number, statement in sorted(self.slowest, reverse=True)
+        ]
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.time())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.time() - conn.info['query_started'].pop()
+    DB_SECONDS.labels(endpoint_label()).observe(seconds)
+    if has_request_context():
+        queries = g.get('queries')
+        if queries is not None:
+            queries.record(statement, seconds)
+
+def _handle_error(context):
+    # a failed statement never reaches after_cursor_execute
+    if context.connection is not None and context.connection.info.get('query_started'):
+        context.connection.info['query_started'].pop()
+
+class QueryProfiler(object):
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.mode = app.config.get('QUERY_PROFILER', 'off')
+        if self.mode not in ('off', 'headers', 'log'):
+            raise ValueError('unknown QUERY_PROFILER %r' % self.mode)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+        if self.mode == 'off':
+            return
+        self.threshold = app.config.get('QUERY_COUNT_THRESHOLD', 20)
+        self.keep = app.config.get('QUERY_PROFILER_SLOWEST', 3)
+        if self.mode == 'log' and not logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+        app.before_request(self.start)
+        app.after_request(self.finish)
+
+    def start(self):
+        g.queries = RequestQueries(self.keep)
+
+    def finish(self, response):
+        queries = g.pop('queries', None)
+        if queries is None:
+            return response
+        over = queries.count > self.threshold
+        ms = queries.seconds * 1000
+        if self.mode == 'headers':
+            response.headers['X-Query-Count'] = str(queries.count)
+            response.headers['X-Query-Time'] = '%.2f' % ms
+            response.headers.add('Server-Timing', 'db;dur=%.2f;desc="%d queries"' % (ms, queries.count))
+            if over:
+                response.headers['X-Query-Warning'] = 'over %d queries' % self.threshold
+                logger.warning('%s %s ran %d queries; slowest: %s', request.method, request.path,
+                               queries.count, json.dumps(queries.slowest_statements()))
+        else:
+            record = {
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'queries': queries.count,
+                'db_ms': round(ms, 2),
+                'slowest': queries.slowest_statements(),
+                'over_threshold': over,
+            }
+            logger.log(logging.WARNING if over else logging.INFO, json.dumps(record, separators=(',', ':')))
+        return response
+
+query_profiler = QueryProfiler()
@@ -0,0 +1,400 @@
+import base64
+from datetime import datetime
+from itertools import groupby
+from math import ceil
+from string import ascii_uppercase
+
+from sqlalchemy import case, cast, func, text, tuple_
+from sqlalchemy.dialects.postgresql import array
+from cache import LRUCache
+from httpcache import data_versions
+from metrics import CACHE_LOOKUPS
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Pagination.
+#----------------------------------------------------------------------------#
+
+LETTERS = list(ascii_uppercase)
+
+class Page(object):
+    # a lightweight page of results, independent of any ORM query
+
+    def __init__(self, items, page, per_page, total):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+
+    @property
+    def pages(self):
+        return int(ceil(self.total / float(self.per_page))) if self.per_page else 0
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    @property
+    def prev_num(self):
+        return self.page - 1
+
+    @property
+    def next_num(self):
+        return self.page + 1
+
+def normalize_letter(letter):
+    letter = (letter or '').strip().upper()[:1]
+    return letter if letter in LETTERS else None
+
+#----------------------------------------------------------------------------#
+# Venue directory.
+#----------------------------------------------------------------------------#
+
+# The distinct (state, city) areas, walked in order as a loose index scan
+# of ix_Venue_state_city_name: each step seeks to the first venue past the
+# previous area, so listing areas costs one index probe per area however
+# many venues each one holds.
+AREAS_SQL = '''
+    WITH RECURSIVE areas AS (
+        (SELECT state, city FROM "Venue"
+         WHERE state IS NOT NULL AND city IS NOT NULL
+         ORDER BY state, city LIMIT 1)
+        UNION ALL
+        SELECT next.state, next.city FROM areas, LATERAL (
+            SELECT state, city FROM "Venue"
+            WHERE (state, city) > (areas.state, areas.city)
+            ORDER BY state, city LIMIT 1
+        ) AS next
+    )
+    SELECT state, city, count(*) OVER () AS total FROM areas
+    WHERE CAST(:letter AS text) IS NULL OR upper(substr(city, 1, 1)) = :letter
+    ORDER BY state, city
+    LIMIT :limit OFFSET :offset
+'''
+
+def venue_directory(page=1, per_page=20, letter=None):
+    # Groups venues by area (city, state). A page of areas comes from the
+    # index walk of AREAS_SQL, then only those areas' venues are read, in
+    # index order and only the columns the template renders, so a page
+    # costs the same however large the catalogue grows.
+    page = max(page, 1)
+    params = {'letter': letter, 'limit': per_page, 'offset': (page - 1) * per_page}
+    areas = db.session.execute(text(AREAS_SQL), params).fetchall()
+    if not areas:
+        # past the last page we still need the area count for the pager
+        total = db.session.execute(text(AREAS_SQL), dict(params, limit=1, offset=0)).fetchall()
+        return Page([], page, per_page, total[0].total if total else 0)
+
+    rows = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.upcoming_shows_count
+    ).\
+      filter(tuple_(Venue.state, Venue.city).in_([(area.state, area.city) for area in areas])).\
+      order_by(Venue.state, Venue.city, Venue.name, Venue.id)
+
+    return Page([{
+        'city': city,
+        'state': state,
+        'venues': [{
+            'id': venue.id,
+            'name': venue.name,
+            'num_upcoming_shows': venue.upcoming_shows_count,
+        } for venue in venues]
+    } for (city, state), venues in groupby(rows, lambda row: (row.city, row.state))],
+      page, per_page, areas[0].total)
+
+#----------------------------------------------------------------------------#
+# Artist directory.
+#----------------------------------------------------------------------------#
+
+# directory totals per letter, keyed on the Artist data version so any
+# write to the table starts a fresh count; counts taken while a write is in
+# flight are not kept
+ARTIST_COUNTS = LRUCache(max_entries=64)
+
+def _artist_initial():
+    # matches the leading column of ix_Artist_initial_name_id
+    return func.upper(func.substr(Artist.name, 1, 1))
+
+def artist_count(letter=None):
+    versions = data_versions(['Artist'])
+    key = (letter, versions[0]) if versions is not None else None
+    total = ARTIST_COUNTS.get(key) if key is not None else None
+    CACHE_LOOKUPS.labels('artist_count', 'miss' if total is None else 'hit').inc()
+    if total is None:
+        query = db.session.query(func.count(Artist.id))
+        if letter:
+            query = query.filter(_artist_initial() == letter)
+        total = query.scalar()
+        if key is not None:
+            ARTIST_COUNTS.set(key, total)
+    return total
+
+def artist_directory(page=1, per_page=50, letter=None):
+    # only the rendered columns, as plain tuples, read in the order of
+    # ix_Artist_name_id (or ix_Artist_initial_name_id for a letter) so a
+    # page stops after its LIMIT instead of sorting every artist; the total
+    # is a separate, cached count
+    page = max(page, 1)
+    query = db.session.query(
+        Artist.id,
+        Artist.name,
+        Artist.upcoming_shows_count
+    )
+    if letter:
+        query = query.filter(_artist_initial() == letter)
+    rows = query.\
+      order_by(Artist.name, Artist.id).\
+      limit(per_page).\
+      offset((page - 1) * per_page).\
+      all()
+    return Page([{
+        'id': row.id,
+        'name': row.name,
+        'num_upcoming_shows': row.upcoming_shows_count,
+    } for row in rows], page, per_page, artist_count(letter))
+
+#----------------------------------------------------------------------------#
+# Genre browse.
+#----------------------------------------------------------------------------#
+
+# Venues and artists by genre, optionally in one state and only those
+# seeking artists/venues. Genre pages filter with @> on the GIN indexes of
+# the genres arrays; the genre index counts every genre in one pass.
+
+GENRE_KINDS = {
+    'venues': (Venue, Venue.seeking_talent),
+    'artists': (Artist, Artist.seeking_venue),
+}
+
+def has_genres(column, genres):
+    # the array is cast to the column's varchar[]: compared with a text[]
+    # the column would be cast instead and its GIN index not used
+    return column.op('@>')(cast(array(genres), column.type))
+
+def _genre_filters(kind, state, seeking):
+    entity, seeking_column = GENRE_KINDS[kind]
+    filters = []
+    if state:
+        filters.append(entity.state == state)
+    if seeking:
+        filters.append(seeking_column.is_(True))
+    return filters
+
+def genre_counts(kind, state=None, seeking=False):
+    # {genre: number of venues/artists}
+    entity, seeking_column = GENRE_KINDS[kind]
+    genres = db.session.query(func.unnest(entity.genres).label('genre')).\
+      filter(*_genre_filters(kind, state, seeking)).\
+      subquery()
+    return dict(db.session.query(genres.c.genre, func.count()).group_by(genres.c.genre))
+
+def genre_page(kind, genre, page=1, per_page=50, state=None, seeking=False):
+    # only the rendered columns; the total rides along as a window count
+    entity, seeking_column = GENRE_KINDS[kind]
+    page = max(page, 1)
+    rows = db.session.query(
+        entity.id,
+        entity.name,
+        entity.city,
+        entity.state,
+        entity.upcoming_shows_count,
+        func.count().over().label('total')
+    ).filter(
+        has_genres(entity.genres, [genre]),
+        *_genre_filters(kind, state, seeking)
+    ).order_by(entity.name, entity.id).\
+      limit(per_page).\
+      offset((page - 1) * per_page).\
+      all()
+    return Page([{
+        'id': row.id,
+        'name': row.name,
+        'city': row.city,
+        'state': row.state,
+        'num_upcoming_shows': row.upcoming_shows_count,
+    } for row in rows], page, per_page, rows[0].total if rows else 0)
+
+#----------------------------------------------------------------------------#
+# Nearby venues.
+#----------------------------------------------------------------------------#
+
+METERS_PER_MILE = 1609.344
+
+def nearby_venues(latitude, longitude, miles, limit=20):
+    # Geocoded venues within `miles` of a point, nearest first, with their
+    # upcoming show counters, in one query. earth_box() bounds the search
+    # on the GiST location index and <-> walks it nearest-first; the box is
+    # a little larger than the circle, so earth_distance() trims it.
+    origin = func.ll_to_earth(latitude, longitude)
+    location = func.ll_to_earth(Venue.latitude, Venue.longitude)
+    meters = miles * METERS_PER_MILE
+    distance = func.earth_distance(origin, location)
+    rows = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.address,
+        Venue.city,
+        Venue.state,
+        Venue.latitude,
+        Venue.longitude,
+        Venue.upcoming_shows_count,
+        distance.label('meters')
+    ).filter(
+        func.earth_box(origin, meters).op('@>')(location),
+        distance <= meters
+    ).order_by(location.op('<->')(origin)).\
+      limit(limit).\
+      all()
+    return [{
+        'id': row.id,
+        'name': row.name,
+        'address': row.address,
+        'city': row.city,
+        'state': row.state,
+        'latitude': row.latitude,
+        'longitude': row.longitude,
+        'miles': round(row.meters / METERS_PER_MILE, 2),
+        'num_upcoming_shows': row.upcoming_shows_count,
+    } for row in rows]
+
+#----------------------------------------------------------------------------#
+# Detail pages.
+#----------------------------------------------------------------------------#
+
+def _load_detail(entity, entity_fk, counterpart, counterpart_fk, prefix, entity_id, now=None):
+    # Loads an entity, its shows split into past/upcoming and both counts in
+    # one round trip. Every row carries the entity columns plus one show; a
+    # single captured "now" decides the partition so no show falls between
+    # two clocks. Returns a plain dict view-model, or None if not found.
+    now = now or datetime.now()
+    is_upcoming = Show.start_time > now
+    rows = db.session.query(
+        *entity.__table__.c,
+        counterpart.id.label(prefix + '_id'),
+        counterpart.name.label(prefix + '_name'),
+        counterpart.image_link.label(prefix + '_image_link'),
+        Show.start_time,
+        case([(is_upcoming, True)], else_=False).label('is_upcoming'),
+        func.count(Show.id).filter(is_upcoming).over().label('live_upcoming_count'),
+        func.count(Show.id).filter(Show.start_time <= now).over().label('live_past_count')
+    ).\
+      select_from(entity).\
+      outerjoin(Show, entity_fk == entity.id).\
+      outerjoin(counterpart, counterpart.id == counterpart_fk).\
+      filter(entity.id == entity_id).\
+      order_by(Show.start_time).\
+      all()
+    if not rows:
+        return None
+
+    first = rows[0]
+    data = dict((column.key, getattr(first, column.key)) for column in entity.__table__.c)
+    data['past_shows'] = []
+    data['upcoming_shows'] = []
+    # exact counts for this "now", rather than the periodically rolled ones
+    data['past_shows_count'] = first.live_past_count
+    data['upcoming_shows_count'] = first.live_upcoming_count
+    for row in rows:
+        if row.start_time is None:
+            continue
+        shows = data['upcoming_shows'] if row.is_upcoming else data['past_shows']
+        shows.append({
+            prefix + '_id': getattr(row, prefix + '_id'),
+            prefix + '_name': getattr(row, prefix + '_name'),
+            prefix + '_image_link': getattr(row, prefix + '_image_link'),
+            'start_time': row.start_time
+        })
+    return data
+
+def venue_detail(venue_id, now=None):
+    return _load_detail(Venue, Show.venue_id, Artist, Show.artist_id, 'artist', venue_id, now)
+
+def artist_detail(artist_id, now=None):
+    return _load_detail(Artist, Show.artist_id, Venue, Show.venue_id, 'venue', artist_id, now)
+
+#----------------------------------------------------------------------------#
+# Shows.
+#----------------------------------------------------------------------------#
+
+def show_tiles():
+    # the columns a show tile renders, venue and artist in the same SELECT
+    return db.session.query(
+        Show.id,
+        Show.start_time,
+        Artist.id.label('artist_id'),
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Venue.id.label('venue_id'),
+        Venue.name.label('venue_name')
+    ).\
+      join(Artist, Artist.id == Show.artist_id).\
+      join(Venue, Venue.id == Show.venue_id)
+
+def show_tile(row):
+    return {
+        'id': row.id,
+        'start_time': row.start_time,
+        'artist': {
+            'id': row.artist_id,
+            'name': row.artist_name,
+            'image_link': row.artist_image_link,
+        },
+        'venue': {
+            'id': row.venue_id,
+            'name': row.venue_name,
+        },
+    }
+
+def encode_cursor(show):
+    key = '%s|%d' % (show['start_time'].isoformat(), show['id'])
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    # raises ValueError for anything that is not a cursor we handed out
+    key = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+    start_time, _, show_id = key.rpartition('|')
+    return datetime.fromisoformat(start_time), int(show_id)
+
+class ShowFeed(object):
+    # one keyset page of the shows feed with cursors to its neighbours
+
+    def __init__(self, items, prev_cursor, next_cursor):
+        self.items = items
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+
+def show_feed(after=None, before=None, limit=30):
+    # Keyset pagination over (start_time, id): each page seeks straight to
+    # its cursor instead of counting past OFFSET rows, so deep pages cost
+    # the same as the first one. One extra row tells us whether more exist.
+    key = tuple_(Show.start_time, Show.id)
+    query = show_tiles()
+    if before:
+        query = query.filter(key < decode_cursor(before)).\
+          order_by(Show.start_time.desc(), Show.id.desc())
+    else:
+        if after:
+            query = query.filter(key > decode_cursor(after))
+        query = query.order_by(Show.start_time, Show.id)
+    rows = query.limit(limit + 1).all()
+
+    more = len(rows) > limit
+    shows = [show_tile(row) for row in rows[:limit]]
+    if before:
+        shows.reverse()
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = bool(after), more
+    return ShowFeed(
+        shows,
+        encode_cursor(shows[0]) if shows and has_prev else None,
+        encode_cursor(shows[-1]) if shows and has_next else None
+    )
@@ -0,0 +1,154 @@
+from datetime import timedelta
+
+from sqlalchemy import text
+from counters import count_new_show_rows
+from forms import ShowForm
+from models import db, Venue, Artist, Show, SHOW_PERIOD, DEFAULT_SHOW_DURATION
+from upcoming import add_upcoming
+
+#----------------------------------------------------------------------------#
+# Show scheduling.
+#----------------------------------------------------------------------------#
+
+# Books shows in batches. A show holds its venue and its artist from
+# start_time for `duration` minutes; it may not overlap another show at the
+# same venue or by the same artist, whether already booked or earlier in the
+# same batch. Existing bookings are checked in one query against the GiST
+# period indexes, and advisory locks on every venue and artist involved keep
+# concurrent batches from booking the same slot.
+
+LOCK_SQL = text('''
+    SELECT pg_advisory_xact_lock(kind, id) FROM (
+        SELECT 1 AS kind, id FROM unnest(CAST(:venue_ids AS integer[])) AS id
+        UNION
+        SELECT 2 AS kind, id FROM unnest(CAST(:artist_ids AS integer[])) AS id
+        ORDER BY kind, id
+    ) AS keys
+''')
+
+CONFLICTS_SQL = text('''
+    WITH batch AS (
+        SELECT * FROM unnest(
+            CAST(:positions AS integer[]),
+            CAST(:artist_ids AS integer[]),
+            CAST(:venue_ids AS integer[]),
+            CAST(:starts AS timestamp[]),
+            CAST(:durations AS integer[])
+        ) AS batch(position, batch_artist_id, batch_venue_id, batch_start, batch_duration)
+    )
+    SELECT position, 'venue' AS side, id FROM batch JOIN "Show"
+        ON venue_id = batch_venue_id
+       AND %(period)s && tsrange(batch_start, batch_start + batch_duration * interval '1 minute')
+    UNION ALL
+    SELECT position, 'artist' AS side, id FROM batch JOIN "Show"
+        ON artist_id = batch_artist_id
+       AND %(period)s && tsrange(batch_start, batch_start + batch_duration * interval '1 minute')
+    ORDER BY position, side
+''' % {'period': SHOW_PERIOD})
+
+_MINUTE = timedelta(minutes=1)
+
+def validate_show(data):
+    # data is a MultiDict as a form would post it; returns (row, errors)
+    form = ShowForm(data, meta={'csrf': False})
+    if not form.validate():
+        return None, form.errors
+    try:
+        artist_id = int(form.artist_id.data)
+        venue_id = int(form.venue_id.data)
+    except (TypeError, ValueError):
+        return None, {'artist_id/venue_id': ['must be integers']}
+    return {
+        'artist_id': artist_id,
+        'venue_id': venue_id,
+        'start_time': form.start_time.data,
+        'duration': form.duration.data or DEFAULT_SHOW_DURATION,
+    }, None
+
+def _ends(row):
+    return row['start_time'] + row['duration'] * _MINUTE
+
+def _overlaps(row, other):
+    return row['start_time'] < _ends(other) and other['start_time'] < _ends(row)
+
+def _booked(rows):
+    # {position: [(side, show id)]} for rows clashing with existing shows
+    clashes = {}
+    result = db.session.execute(CONFLICTS_SQL, {
+        'positions': [position for position, row in rows],
+        'artist_ids': [row['artist_id'] for position, row in rows],
+        'venue_ids': [row['venue_id'] for position, row in rows],
+        'starts': [row['start_time'] for position, row in rows],
+        'durations': [row['duration'] for position, row in rows],
+    })
+    for position, side, show_id in result:
+        clashes.setdefault(position, []).append((side, show_id))
+    return clashes
+
+def schedule_shows(records, atomic=False):
+    # Validates and books a batch of shows. records are MultiDicts with
+    # artist_id, venue_id, start_time and (optionally) duration. Rows that
+    # are invalid or clash are reported and skipped, or with atomic=True
+    # nothing is booked unless every row can be. The caller commits.
+    errors = []
+    conflicts = []
+    rows = []
+    for position, data in enumerate(records):
+        row, row_errors = validate_show(data)
+        if row_errors:
+            errors.append({'index': position, 'errors': row_errors})
+        else:
+            rows.append((position, row))
+
+    if rows:
+        artists = set(id for id, in db.session.query(Artist.id).filter(
+            Artist.id.in_(set(row['artist_id'] for position, row in rows))))
+        venues = set(id for id, in db.session.query(Venue.id).filter(
+            Venue.id.in_(set(row['venue_id'] for position, row in rows))))
+        known = []
+        for position, row in rows:
+            if row['artist_id'] not in artists:
+                errors.append({'index': position, 'errors': {'artist_id': ['no such artist']}})
+            elif row['venue_id'] not in venues:
+                errors.append({'index': position, 'errors': {'venue_id': ['no such venue']}})
+            else:
+                known.append((position, row))
+        rows = known
+
+    accepted = []
+    if rows:
+        db.session.execute(LOCK_SQL, {
+            'venue_ids': sorted(venues),
+            'artist_ids': sorted(artists),
+        })
+        booked = _booked(rows)
+        # earlier rows of the batch win over later ones
+        taken = {}
+        for position, row in rows:
+            clashes = [{'index': position, 'conflict': side, 'show_id': show_id}
+                       for side, show_id in booked.get(position, [])]
+            for side in ('venue', 'artist'):
+                for other_position, other in taken.get((side, row[side + '_id']), []):
+                    if _overlaps(row, other):
+                        clashes.append({'index': position, 'conflict': side, 'batch_index': other_position})
+            if clashes:
+                conflicts.extend(clashes)
+                continue
+            accepted.append((position, row))
+            for side in ('venue', 'artist'):
+                taken.setdefault((side, row[side + '_id']), []).append((position, row))
+
+    if atomic and (errors or conflicts):
+        accepted = []
+
+    scheduled = []
+    if accepted:
+        values = [row for position, row in accepted]
+        count_new_show_rows(values)
+        ids = [id for id, in db.session.execute(
+            Show.__table__.insert().values(values).returning(Show.__table__.c.id))]
+        add_upcoming(ids)
+        scheduled = [{'index': position, 'id': id} for (position, row), id in zip(accepted, ids)]
+
+    errors.sort(key=lambda error: error['index'])
+    return {'scheduled': scheduled, 'conflicts': conflicts, 'errors': errors}
@@ -0,0 +1,108 @@
+from sqlalchemy import and_, func, or_
+from forms import genre_choices
+from models import db, Venue, Artist, Show
+from queries import Page, has_genres, show_tile, show_tiles
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+# Ranked, paginated search over venues, artists and shows. Partial,
+# case-insensitive matches use ILIKE, which Postgres answers from the
+# pg_trgm GIN indexes, and a genre name matches through the GIN indexes on
+# the genres arrays; results are ordered by trigram similarity.
+
+GENRES = dict((value.lower(), value) for value, label in genre_choices)
+
+class SearchTerm(object):
+    # a parsed search term; "San Francisco, CA" also matches city and state
+
+    def __init__(self, raw):
+        self.raw = (raw or '').strip()
+        self.pattern = '%' + escape_like(self.raw) + '%'
+        self.genres = [GENRES[self.raw.lower()]] if self.raw.lower() in GENRES else []
+        city, _, state = self.raw.rpartition(',')
+        self.city = city.strip() or None
+        self.state = state.strip() or None
+
+def escape_like(value):
+    # backslash is the default LIKE escape character in Postgres
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _matches(term, name, city, state, genres):
+    clauses = [
+        name.ilike(term.pattern),
+        city.ilike(term.pattern),
+        state.ilike(escape_like(term.raw))
+    ]
+    if term.city and term.state:
+        clauses.append(and_(
+            city.ilike(escape_like(term.city)),
+            state.ilike(escape_like(term.state))
+        ))
+    if term.genres:
+        clauses.append(has_genres(genres, term.genres))
+    return or_(*clauses)
+
+def _rank(term, name, city):
+    return func.greatest(
+        func.similarity(name, term.raw),
+        func.similarity(city, term.city or term.raw) * 0.8
+    )
+
+def _paginate(query, rank, order, page, per_page, build):
+    # a single round trip: the total rides along as a window count
+    page = max(page, 1)
+    rows = query.\
+      add_columns(func.count().over().label('total')).\
+      order_by(rank.desc(), *order).\
+      limit(per_page).\
+      offset((page - 1) * per_page).\
+      all()
+    total = rows[0].total if rows else 0
+    return Page([build(row) for row in rows], page, per_page, total)
+
+def _listing(row):
+    return {
+        'id': row.id,
+        'name': row.name,
+        'city': row.city,
+        'state': row.state,
+        'num_upcoming_shows': row.upcoming_shows_count,
+    }
+
+def search_venues(raw_term, page=1, per_page=20):
+    term = SearchTerm(raw_term)
+    rank = _rank(term, Venue.name, Venue.city)
+    query = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, Venue.upcoming_shows_count).\
+      filter(_matches(term, Venue.name, Venue.city, Venue.state, Venue.genres))
+    return _paginate(query, rank, (Venue.name, Venue.id), page, per_page, _listing)
+
+def search_artists(raw_term, page=1, per_page=20):
+    term = SearchTerm(raw_term)
+    rank = _rank(term, Artist.name, Artist.city)
+    query = db.session.query(Artist.id, Artist.name, Artist.city, Artist.state, Artist.upcoming_shows_count).\
+      filter(_matches(term, Artist.name, Artist.city, Artist.state, Artist.genres))
+    return _paginate(query, rank, (Artist.name, Artist.id), page, per_page, _listing)
+
+def search_shows(raw_term, page=1, per_page=20):
+    # a UNION of the shows of matching artists and the shows of matching
+    # venues: each side finds its artists or venues from their indexes and
+    # their shows from ix_Show_artist_id_start_time or
+    # ix_Show_venue_id_start_time, where an OR over both would scan "Show";
+    # the UNION also drops a show matched from both sides
+    term = SearchTerm(raw_term)
+    artist_shows = db.session.query(Show.id.label('show_id')).\
+      join(Artist, Artist.id == Show.artist_id).\
+      filter(_matches(term, Artist.name, Artist.city, Artist.state, Artist.genres))
+    venue_shows = db.session.query(Show.id.label('show_id')).\
+      join(Venue, Venue.id == Show.venue_id).\
+      filter(_matches(term, Venue.name, Venue.city, Venue.state, Venue.genres))
+    matched = artist_shows.union(venue_shows).subquery()
+    rank = func.greatest(
+        func.similarity(Artist.name, term.raw),
+        func.similarity(Venue.name, term.raw)
+    )
+    query = show_tiles().\
+      join(matched, matched.c.show_id == Show.id)
+    return _paginate(query, rank, (Show.start_time, Show.id), page, per_page, show_tile)
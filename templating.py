@@ -0,0 +1,53 @@
+import os
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache
+
+#----------------------------------------------------------------------------#
+# Template bytecode cache.
+#----------------------------------------------------------------------------#
+
+# Compiled templates are kept as bytecode under TEMPLATE_CACHE_DIR, shared
+# by every worker on the host, so a new or recycled worker loads them
+# instead of compiling layouts/main.html and each page on its first hits.
+# `flask templates compile` fills the cache at build time. Entries are keyed
+# by template name and absolute path and checked against the source, so an
+# edited template is recompiled; build where the app will run, with the
+# same Python. Outside debug, TEMPLATES_AUTO_RELOAD is off and Jinja never
+# stats template files once they are loaded.
+
+def init_template_cache(app):
+    # call before anything touches app.jinja_env, which is built once
+    directory = app.config.get('TEMPLATE_CACHE_DIR')
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_options = dict(app.jinja_options, bytecode_cache=FileSystemBytecodeCache(directory))
+
+def compile_templates(app):
+    # loads every template, writing its bytecode to the cache; returns the
+    # template names
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+templates_cli = AppGroup('templates', help='Manage compiled templates.')
+
+@templates_cli.command('compile')
+@click.option('--clear', is_flag=True, help='Drop cached bytecode first.')
+def compile_command(clear):
+    """Compile every template into the bytecode cache."""
+    cache = current_app.jinja_env.bytecode_cache
+    if cache is None:
+        raise click.ClickException('TEMPLATE_CACHE_DIR is not set')
+    if clear:
+        cache.clear()
+    names = compile_templates(current_app)
+    click.echo('%d templates compiled into %s' % (len(names), current_app.config['TEMPLATE_CACHE_DIR']))
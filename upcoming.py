@@ -0,0 +1,176 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, text
+from models import db, UpcomingShow
+from queries import Page
+
+#----------------------------------------------------------------------------#
+# Upcoming shows calendar.
+#----------------------------------------------------------------------------#
+
+# UpcomingShow holds one row per upcoming show, bucketed by day and carrying
+# the venue and artist fields the calendar shows, so calendar pages never
+# touch Show, Venue or Artist. It is kept current incrementally: booked
+# shows are added in the transaction that books them, venue and artist
+# edits rewrite their rows, deleted shows cascade. `flask calendar refresh`
+# (run from cron with `flask counters roll`) drops shows that have started
+# and picks up anything changed since --since, e.g. by bulk imports.
+
+UPSERT_SQL = '''
+    INSERT INTO "UpcomingShow" (show_id, day, start_time, duration,
+                                venue_id, venue_name, venue_city, venue_state,
+                                artist_id, artist_name, artist_image_link)
+    SELECT "Show".id, "Show".start_time::date, "Show".start_time, "Show".duration,
+           "Venue".id, "Venue".name, "Venue".city, "Venue".state,
+           "Artist".id, "Artist".name, "Artist".image_link
+    FROM "Show"
+    JOIN "Venue" ON "Venue".id = "Show".venue_id
+    JOIN "Artist" ON "Artist".id = "Show".artist_id
+    WHERE "Show".start_time > :now AND (%s)
+    ON CONFLICT (show_id) DO UPDATE SET
+        day = excluded.day,
+        start_time = excluded.start_time,
+        duration = excluded.duration,
+        venue_id = excluded.venue_id,
+        venue_name = excluded.venue_name,
+        venue_city = excluded.venue_city,
+        venue_state = excluded.venue_state,
+        artist_id = excluded.artist_id,
+        artist_name = excluded.artist_name,
+        artist_image_link = excluded.artist_image_link
+'''
+
+ADD_SQL = text(UPSERT_SQL % '"Show".id = ANY(CAST(:show_ids AS integer[]))')
+
+CHANGED_SQL = text(UPSERT_SQL % '''
+    "Show".updated_at > :since OR "Venue".updated_at > :since OR "Artist".updated_at > :since
+''')
+
+REBUILD_SQL = [
+    text('TRUNCATE "UpcomingShow"'),
+    text(UPSERT_SQL % 'true'),
+]
+
+ROLL_SQL = text('DELETE FROM "UpcomingShow" WHERE start_time <= :now')
+
+def add_upcoming(show_ids, now=None):
+    # call with newly booked show ids before committing
+    if show_ids:
+        db.session.execute(ADD_SQL, {'show_ids': list(show_ids), 'now': now or datetime.now()})
+
+def update_venue_upcoming(venue):
+    table = UpcomingShow.__table__
+    db.session.execute(table.update().where(table.c.venue_id == venue.id).values(
+        venue_name=venue.name, venue_city=venue.city, venue_state=venue.state))
+
+def update_artist_upcoming(artist):
+    table = UpcomingShow.__table__
+    db.session.execute(table.update().where(table.c.artist_id == artist.id).values(
+        artist_name=artist.name, artist_image_link=artist.image_link))
+
+def refresh_upcoming(since, now=None):
+    # drops started shows and upserts shows whose row, venue or artist
+    # changed after `since`; returns (dropped, upserted)
+    now = now or datetime.now()
+    dropped = db.session.execute(ROLL_SQL, {'now': now}).rowcount
+    upserted = db.session.execute(CHANGED_SQL, {'now': now, 'since': since}).rowcount
+    return dropped, upserted
+
+def rebuild_upcoming(now=None):
+    for statement in REBUILD_SQL:
+        db.session.execute(statement, {'now': now or datetime.now()})
+
+#----------------------------------------------------------------------------#
+# Calendar pages.
+#----------------------------------------------------------------------------#
+
+CalendarDay = namedtuple('CalendarDay', 'day total shows')
+
+def calendar_range(view, day):
+    # first and last day of the day, week (from Monday) or month around day
+    if view == 'day':
+        return day, day
+    if view == 'week':
+        first = day - timedelta(days=day.weekday())
+        return first, first + timedelta(days=6)
+    first = day.replace(day=1)
+    following = (first + timedelta(days=32)).replace(day=1)
+    return first, following - timedelta(days=1)
+
+def _entry(row):
+    return {
+        'id': row.show_id,
+        'start_time': row.start_time,
+        'duration': row.duration,
+        'venue': {'id': row.venue_id, 'name': row.venue_name,
+                  'city': row.venue_city, 'state': row.venue_state},
+        'artist': {'id': row.artist_id, 'name': row.artist_name,
+                   'image_link': row.artist_image_link},
+    }
+
+def calendar_days(first, last, per_day, now=None):
+    # every day from first to last with its number of upcoming shows and
+    # the earliest per_day of them, in one query
+    entries = db.session.query(
+        UpcomingShow,
+        func.row_number().over(
+            partition_by=UpcomingShow.day,
+            order_by=(UpcomingShow.start_time, UpcomingShow.show_id)
+        ).label('position'),
+        func.count().over(partition_by=UpcomingShow.day).label('day_total')
+    ).filter(
+        UpcomingShow.day.between(first, last),
+        UpcomingShow.start_time > (now or datetime.now())
+    ).subquery()
+    rows = db.session.query(entries).filter(entries.c.position <= per_day).order_by(
+        entries.c.day, entries.c.position)
+
+    by_day = {}
+    for row in rows:
+        by_day.setdefault(row.day, []).append(row)
+    days = []
+    day = first
+    while day <= last:
+        shows = by_day.get(day, [])
+        days.append(CalendarDay(day, shows[0].day_total if shows else 0, [_entry(row) for row in shows]))
+        day += timedelta(days=1)
+    return days
+
+def calendar_day(day, page, per_page, now=None):
+    # one day's upcoming shows, a page at a time
+    page = max(page, 1)
+    rows = db.session.query(
+        UpcomingShow, func.count().over().label('total')
+    ).filter(
+        UpcomingShow.day == day,
+        UpcomingShow.start_time > (now or datetime.now())
+    ).order_by(
+        UpcomingShow.start_time, UpcomingShow.show_id
+    ).limit(per_page).offset((page - 1) * per_page).all()
+    total = rows[0].total if rows else 0
+    return Page([_entry(row.UpcomingShow) for row in rows], page, per_page, total)
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+calendar_cli = AppGroup('calendar', help='Maintain the upcoming shows calendar.')
+
+@calendar_cli.command('refresh')
+@click.option('--since', type=click.DateTime(), default=None,
+              help='Pick up rows changed after this time (default: an hour ago).')
+def refresh_command(since):
+    """Drop started shows and pick up recent changes."""
+    dropped, upserted = refresh_upcoming(since or datetime.now() - timedelta(hours=1))
+    db.session.commit()
+    click.echo('%d started shows dropped, %d shows refreshed' % (dropped, upserted))
+
+@calendar_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild the calendar from the Show table."""
+    rebuild_upcoming()
+    db.session.commit()
+    click.echo('calendar rebuilt')
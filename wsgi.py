@@ -0,0 +1,41 @@
+#----------------------------------------------------------------------------#
+# WSGI entry point.
+#----------------------------------------------------------------------------#
+
+# For gunicorn with --preload (see gunicorn.conf.py):
+#
+#   SECRET_KEY=... gunicorn -c gunicorn.conf.py wsgi:application
+#
+# The app is built and warmed in the master before it forks: every template
+# loaded (from the bytecode cache once `flask templates compile` has run),
+# babel locale data and date patterns loaded, the engine created and its
+# dialect initialised. Workers start with all of that already in memory,
+# shared copy-on-write, instead of each paying for it on their first
+# requests. bench/startup.py measures the difference.
+
+import time
+
+started = time.time()
+
+from app import create_app, require_secret_key
+from formatting import PATTERNS, formatter
+from models import db
+from templating import compile_templates
+
+def warm_up(app):
+    with app.app_context():
+        compile_templates(app)
+        for format in PATTERNS:
+            formatter.pattern(format)
+        engine = db.get_engine(app)
+        try:
+            # the first connection initialises the dialect (server version,
+            # type handling); close it so no socket is shared across forks
+            engine.connect().close()
+        except Exception as err:
+            app.logger.warning('database not reachable while warming up: %s', err)
+        engine.dispose()
+
+application = require_secret_key(create_app())
+warm_up(application)
+application.logger.info('app ready in %.2fs', time.time() - started)